@@ -0,0 +1,58 @@
+import argparse
+import time
+
+import numpy as np
+
+import blocks
+
+
+def make_filter(causal, sampling_freq, carrier_freq, half_band_width):
+    filter_block = blocks.filters.BandPassFilter()
+    filter_block.filter_output = 'sos'
+    filter_block.causal = causal
+    filter_block.sampling_frequency = sampling_freq
+    filter_block.freqs = [carrier_freq - half_band_width,
+                          carrier_freq + half_band_width]
+    return filter_block
+
+
+def measure(filter_block, samples, frame_size):
+    filter_block.reset_stream()
+    frame_times = []
+    start = time.perf_counter()
+    for pos in range(0, samples.size, frame_size):
+        frame_start = time.perf_counter()
+        filter_block.process_frame(samples[pos:pos + frame_size])
+        frame_times.append(time.perf_counter() - frame_start)
+    filter_block.flush_stream()
+    elapsed = time.perf_counter() - start
+    return {'throughput': samples.size / elapsed,
+            'frame_time': float(np.median(frame_times)),
+            'latency': get_latency(filter_block, frame_size)}
+
+
+def get_latency(filter_block, frame_size):
+    # samples between an input sample arriving and its output leaving
+    return frame_size + filter_block.group_delay + filter_block.stream_lookahead
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zero-phase versus causal band-pass filter on frames.")
+    parser.add_argument('--samples', type=int, default=10 ** 6)
+    parser.add_argument('--frame', type=int, default=4096)
+    args = parser.parse_args()
+
+    carrier_freq = 100e6
+    sampling_freq = 32 * carrier_freq
+    samples = np.random.randn(args.samples)
+    print("{0:<12}{1:>16}{2:>16}{3:>16}".format("mode", "samples/s", "frame time [s]", "latency [s]"))
+    for causal in (False, True):
+        filter_block = make_filter(causal, sampling_freq, carrier_freq, 10e6)
+        result = measure(filter_block, samples, args.frame)
+        print("{0:<12}{1:>16.4g}{2:>16.4g}{3:>16.4g}".format(
+            "causal" if causal else "zero-phase", result['throughput'],
+            result['frame_time'], result['latency'] / sampling_freq))
+
+
+if __name__ == "__main__":
+    main()
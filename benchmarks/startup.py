@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Every case runs in a fresh interpreter, as a spawned pool worker or a
+# short headless job starts. 'python' alone is the floor.
+CASES = ('python', 'blocks', 'utils', 'system', 'scenarios', 'sweep', 'main', 'plots')
+# heavy modules, reported when a case loads them
+HEAVY_MODULES = ('scipy.signal', 'scipy.stats', 'matplotlib')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{0}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {1!r} if name in sys.modules]}}))
+"""
+
+
+def measure(case, repeat):
+    # best import time of repeated runs and wall time of the whole process
+    statement = 'pass' if case == 'python' else 'import ' + case
+    environment = dict(os.environ, PYTHONPATH=ROOT, MPLBACKEND='Agg')
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', PROBE.format(statement, HEAVY_MODULES)],
+                                         env=environment, cwd=ROOT)
+        process_seconds = time.perf_counter() - start
+        record = json.loads(output.decode('utf-8'))
+        record['process_seconds'] = process_seconds
+        if best is None or record['seconds'] < best['seconds']:
+            best = record
+    best['case'] = case
+    return best
+
+
+def get_environment():
+    return {'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of modules in fresh interpreters.")
+    parser.add_argument('--case', nargs='+', choices=CASES, help="modules to import (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per case, best one counts")
+    parser.add_argument('--output', help="JSON file for results (default: stdout)")
+    args = parser.parse_args()
+
+    results = []
+    for case in args.case or CASES:
+        record = measure(case, args.repeat)
+        results.append(record)
+        print("{case:<16}{seconds:>10.3f}{process_seconds:>10.3f}  {0}".format(
+            ' '.join(record['loaded']), **record), file=sys.stderr)
+    results = {'environment': get_environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
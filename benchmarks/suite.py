@@ -0,0 +1,315 @@
+import argparse
+import collections
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+import blocks
+import system
+import utils
+
+
+# Every case turns simulation parameters into a callable doing one full
+# computation. Inputs are prepared outside of measured calls.
+CASES = collections.OrderedDict()
+
+DEFAULT_LENGTHS = (10 ** 4, 10 ** 5, 10 ** 6)
+FULL_LENGTHS = (10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)
+
+# sample precision and buffer reuse of measured blocks, set by --dtype
+# and --in-place
+PRECISION = {'dtype': 'float64', 'in_place': False}
+
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def get_parameters(length):
+    parameters = utils.SimulationParameters.mock()
+    return parameters.replace(generation_time=length / parameters.sampling_freq)
+
+
+def get_signal_band(parameters):
+    half_band_width = parameters.modulating_freq + parameters.freq_deviation
+    return [parameters.carrier_freq - half_band_width,
+            parameters.carrier_freq + half_band_width]
+
+
+def set_precision(node):
+    # block or system
+    node.dtype = PRECISION['dtype']
+    node.in_place = PRECISION['in_place']
+
+
+def prepare(block, parameters, samples=None):
+    block.sampling_frequency = parameters.sampling_freq
+    set_precision(block)
+    if samples is not None:
+        block.input = samples
+
+    def run():
+        block.invalidate()
+        return block.output
+    return run
+
+
+def make_message(parameters):
+    generator = blocks.generators.BandNoiseGenerator()
+    generator.generation_time = parameters.generation_time
+    generator.bandwidth = parameters.modulating_freq
+    generator.sampling_frequency = parameters.sampling_freq
+    generator.dtype = PRECISION['dtype']
+    return generator.output
+
+
+def make_modulated(parameters):
+    modulator = blocks.modems.FrequencyModulator()
+    modulator.carrier_frequency = parameters.carrier_freq
+    modulator.frequency_deviation = parameters.freq_deviation
+    modulator.sampling_frequency = parameters.sampling_freq
+    modulator.dtype = PRECISION['dtype']
+    modulator.input = make_message(parameters)
+    return modulator.output
+
+
+def make_oscillator(generator_type, parameters):
+    generator = generator_type()
+    generator.generation_time = parameters.generation_time
+    generator.frequency = parameters.modulating_freq
+    return prepare(generator, parameters)
+
+
+@case('SineGenerator')
+def sine_generator(parameters):
+    return make_oscillator(blocks.generators.SineGenerator, parameters)
+
+
+@case('SquareGenerator')
+def square_generator(parameters):
+    return make_oscillator(blocks.generators.SquareGenerator, parameters)
+
+
+@case('SawGenerator')
+def saw_generator(parameters):
+    return make_oscillator(blocks.generators.SawGenerator, parameters)
+
+
+@case('NoiseGenerator')
+def noise_generator(parameters):
+    generator = blocks.generators.NoiseGenerator()
+    generator.generation_time = parameters.generation_time
+    return prepare(generator, parameters)
+
+
+@case('BandNoiseGenerator')
+def band_noise_generator(parameters):
+    generator = blocks.generators.BandNoiseGenerator()
+    generator.generation_time = parameters.generation_time
+    generator.bandwidth = parameters.modulating_freq
+    return prepare(generator, parameters)
+
+
+@case('FrequencyModulator')
+def frequency_modulator(parameters):
+    modulator = blocks.modems.FrequencyModulator()
+    modulator.carrier_frequency = parameters.carrier_freq
+    modulator.frequency_deviation = parameters.freq_deviation
+    return prepare(modulator, parameters, make_message(parameters))
+
+
+@case('MultiPathChannel')
+def multi_path_channel(parameters):
+    channel = blocks.channels.MultiPathChannel(paths=parameters.channel_paths)
+    return prepare(channel, parameters, make_modulated(parameters))
+
+
+@case('FadingChannel')
+def fading_channel(parameters):
+    channel = blocks.channels.FadingChannel(paths=parameters.channel_paths)
+    channel.carrier_frequency = parameters.carrier_freq
+    return prepare(channel, parameters, make_modulated(parameters))
+
+
+@case('BandNoiser')
+def band_noiser(parameters):
+    noiser = blocks.noisers.BandNoiser()
+    noiser.expected_snr = parameters.expected_snr
+    noiser.freqs = get_signal_band(parameters)
+    return prepare(noiser, parameters, make_modulated(parameters))
+
+
+@case('BandPassFilter')
+def band_pass_filter(parameters):
+    filter_block = blocks.filters.BandPassFilter()
+    filter_block.freqs = get_signal_band(parameters)
+    return prepare(filter_block, parameters, make_modulated(parameters))
+
+
+@case('BandPassFilter.sos')
+def band_pass_filter_sos(parameters):
+    filter_block = blocks.filters.BandPassFilter()
+    filter_block.filter_output = 'sos'
+    filter_block.freqs = get_signal_band(parameters)
+    return prepare(filter_block, parameters, make_modulated(parameters))
+
+
+@case('FrequencyDemodulator')
+def frequency_demodulator(parameters):
+    demodulator = blocks.modems.FrequencyDemodulator()
+    demodulator.carrier_frequency = parameters.carrier_freq
+    demodulator.frequency_deviation = parameters.freq_deviation
+    return prepare(demodulator, parameters, make_modulated(parameters))
+
+
+@case('DecimatingFrequencyDemodulator')
+def decimating_frequency_demodulator(parameters):
+    demodulator = blocks.modems.DecimatingFrequencyDemodulator()
+    demodulator.carrier_frequency = parameters.carrier_freq
+    demodulator.frequency_deviation = parameters.freq_deviation
+    demodulator.bandwidth = parameters.modulating_freq + parameters.freq_deviation
+    return prepare(demodulator, parameters, make_modulated(parameters))
+
+
+@case('SpectrumAnalyzer')
+def spectrum_analyzer(parameters):
+    return prepare(blocks.analyzers.SpectrumAnalyzer(), parameters, make_modulated(parameters))
+
+
+@case('Combiner')
+def combiner(parameters):
+    combiner_block = blocks.combiners.Combiner()
+    modulated = make_modulated(parameters)
+    combiner_block.set_port('other', modulated[::-1])
+    return prepare(combiner_block, parameters, modulated)
+
+
+@case('chain')
+def chain(parameters):
+    # the same system InteractiveRunner builds
+    simulated = system.SystemBuilder(parameters).build()
+    set_precision(simulated)
+    generator = simulated.get_block(simulated.GENERATOR)
+
+    def run():
+        generator.invalidate()
+        return simulated.evaluate(simulated.DEMODULATOR)
+    return run
+
+
+def measure(run, length, repeat):
+    # Best of `repeat` timings, then one traced run for peak memory, since
+    # tracemalloc slows allocations down; throughput counts input samples.
+    # An untimed run goes first, so lazy scipy imports and filter design
+    # cache misses are not timed.
+    run()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best,
+            'throughput': length / best,
+            'peak_memory': peak}
+
+
+def run_suite(names, lengths, repeat):
+    results = []
+    for name in names:
+        for length in lengths:
+            run = CASES[name](get_parameters(length))
+            record = {'case': name, 'samples': length}
+            record.update(PRECISION)
+            record.update(measure(run, length, repeat))
+            results.append(record)
+            print("{case:<32}{samples:>12}{throughput:>16.4g}{peak_memory:>16}".format(**record),
+                  file=sys.stderr)
+    return results
+
+
+def get_environment():
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def get_record_key(record):
+    # results from before precision options count as float64, not in place
+    return (record['case'], record['samples'],
+            record.get('dtype', 'float64'), record.get('in_place', False))
+
+
+def compare(results, baseline, threshold):
+    # regressions: throughput dropped or peak memory grew by over threshold
+    reference = {get_record_key(record): record for record in baseline['results']}
+    regressions = []
+    for record in results:
+        old = reference.get(get_record_key(record))
+        if old is None:
+            continue
+        for field, ratio in (('throughput', old['throughput'] / record['throughput']),
+                             ('peak_memory', record['peak_memory'] / max(old['peak_memory'], 1))):
+            if ratio > 1 + threshold:
+                regressions.append({'case': record['case'], 'samples': record['samples'],
+                                    'field': field, 'baseline': old[field],
+                                    'current': record[field], 'ratio': ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and peak memory of blocks and the whole chain.")
+    parser.add_argument('--case', nargs='+', choices=list(CASES), help="cases to run (default: all)")
+    parser.add_argument('--lengths', type=float, nargs='+', help="signal lengths [samples]")
+    parser.add_argument('--full', action='store_true', help="lengths from 1e4 up to 1e8 samples")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs, best one counts")
+    parser.add_argument('--dtype', choices=('float64', 'float32'), default='float64',
+                        help="precision of samples")
+    parser.add_argument('--in-place', action='store_true', help="blocks reuse output and work arrays")
+    parser.add_argument('--output', help="JSON file for results (default: stdout)")
+    parser.add_argument('--baseline', help="JSON results to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown or memory growth counted as regression")
+    args = parser.parse_args()
+
+    PRECISION.update(dtype=args.dtype, in_place=args.in_place)
+    if args.lengths:
+        lengths = [int(length) for length in args.lengths]
+    else:
+        lengths = FULL_LENGTHS if args.full else DEFAULT_LENGTHS
+    results = {'environment': get_environment(),
+               'results': run_suite(args.case or list(CASES), lengths, args.repeat)}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results['results'], json.load(baseline), args.threshold)
+        for regression in regressions:
+            print("Regression: {case} @ {samples} {field} {baseline:.4g} -> {current:.4g}".format(**regression),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
-from . import channels
-from . import filters
-from . import generators
-from . import meta
-from . import modems
-from . import noisers
+import importlib
+
+# Submodules load on first use, so `import blocks` costs next to nothing
+# and scipy is imported only by blocks that need it, see lazy.LazyModule.
+__all__ = ['analyzers', 'channels', 'combiners', 'designs', 'filters', 'generators',
+           'lazy', 'meta', 'metrics', 'modems', 'noisers', 'profiling']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
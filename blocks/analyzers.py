@@ -0,0 +1,196 @@
+import numpy as np
+
+from blocks.lazy import LazyModule
+from blocks.meta import AbstractBlock, append_samples
+
+signal = LazyModule('scipy.signal')
+
+
+class SpectrumAnalyzer(AbstractBlock):
+    # Welch estimate of power spectrum: mean removed, windowed segments of
+    # `segment_size` samples, `overlap` of them shared by neighbours, are
+    # zero padded to `fft_size` and their squared spectra averaged, as
+    # signal.welch does. Output is two-sided, zero frequency in the middle,
+    # see `frequencies`; scaling is 'density' (V^2/Hz) or 'spectrum' (V^2).
+    # Streamed frames pass through unchanged and are accumulated on the
+    # way, so the estimate is the same as in batch, memory stays constant
+    # and `spectrum` is readable at any point of a stream.
+    # segments transformed at once, bounds temporaries on long inputs
+    SEGMENTS_PER_CHUNK = 64
+    STATIC_SIGNALS = ('frequencies', 'spectrum')
+
+    def __init__(self, segment_size=1024, overlap=None, window='hann', fft_size=None, scaling='density'):
+        # pylint: disable=too-many-arguments
+        super(SpectrumAnalyzer, self).__init__()
+        self._segment_size = segment_size
+        self._overlap = overlap
+        self._window = window
+        self._fft_size = fft_size
+        self._scaling = None
+        self.scaling = scaling
+        self._power_sum = None
+        self._segments = 0
+        self._onesided = False
+        self._pending = None
+
+    @property
+    def segment_size(self):
+        return self._segment_size
+
+    @segment_size.setter
+    def segment_size(self, size):
+        if size != self._segment_size:
+            self._segment_size = size
+            self._invalidate()
+
+    @property
+    def overlap(self):
+        # None means half of segment
+        return self._overlap
+
+    @overlap.setter
+    def overlap(self, overlap):
+        if overlap != self._overlap:
+            self._overlap = overlap
+            self._invalidate()
+
+    @property
+    def window(self):
+        # name or tuple for signal.get_window, or array of segment_size
+        return self._window
+
+    @window.setter
+    def window(self, window):
+        if not np.array_equal(window, self._window):
+            self._window = window
+            self._invalidate()
+
+    @property
+    def fft_size(self):
+        # None means segment_size
+        return self._fft_size
+
+    @fft_size.setter
+    def fft_size(self, size):
+        if size != self._fft_size:
+            self._fft_size = size
+            self._invalidate()
+
+    @property
+    def scaling(self):
+        return self._scaling
+
+    @scaling.setter
+    def scaling(self, scaling):
+        if scaling not in ('density', 'spectrum'):
+            raise ValueError("Expected 'density' or 'spectrum' scaling. Found {0}".format(scaling))
+        if scaling != self._scaling:
+            self._scaling = scaling
+            self._invalidate()
+
+    @property
+    def frequencies(self):
+        return np.fft.fftshift(np.fft.fftfreq(self._get_fft_size(), self._get_time_step() or 1))
+
+    @property
+    def spectrum(self):
+        # current estimate, also while streaming; None before any segment
+        if not self._segments:
+            return None
+        window = self._get_window()
+        if self._scaling == 'density':
+            scale = self._sampling_frequency * np.sum(window ** 2)
+        else:
+            scale = np.sum(window) ** 2
+        return self._get_power() / (scale * self._segments)
+
+    @property
+    def segments(self):
+        # count averaged so far
+        return self._segments
+
+    def band_power(self, low, high):
+        # Power of signal within band, by Parseval. Real signals have it
+        # at negative frequencies too, both sides are counted.
+        if not self._segments:
+            return None
+        frequencies = self.frequencies
+        if self._onesided:
+            frequencies = np.abs(frequencies)
+        band = (frequencies >= low) & (frequencies <= high)
+        power = np.sum(self._get_power()[..., band], axis=-1)
+        return power / (self._get_fft_size() * np.sum(self._get_window() ** 2) * self._segments)
+
+    @property
+    def recorded_signals(self):
+        signals = super(SpectrumAnalyzer, self).recorded_signals
+        signals['frequencies'] = self.frequencies
+        return signals
+
+    def _compute(self):
+        self._reset_stream()
+        self._accumulate(self._input)
+        self._pending = None
+        self._output = self.spectrum
+
+    def _reset_stream(self):
+        if self._segment_size - self._get_overlap() < 1:
+            raise ValueError("Overlap has to be smaller than segment size.")
+        self._power_sum = None
+        self._segments = 0
+        self._pending = None
+
+    def _compute_frame(self, frame):
+        self._accumulate(frame)
+        return frame
+
+    def _flush_stream(self):
+        # like batch, samples short of a whole segment are left out
+        self._pending = None
+        return np.zeros(0)
+
+    def _accumulate(self, samples):
+        samples = append_samples(self._pending, samples)
+        size = self._segment_size
+        step = size - self._get_overlap()
+        count = max(0, (samples.shape[-1] - size) // step + 1)
+        if count and self._power_sum is None:
+            self._onesided = not np.iscomplexobj(samples)
+        for first in range(0, count, self.SEGMENTS_PER_CHUNK):
+            last = min(count, first + self.SEGMENTS_PER_CHUNK)
+            chunk = samples[..., first * step:(last - 1) * step + size]
+            power = self._compute_power(np.lib.stride_tricks.sliding_window_view(chunk, size, axis=-1)[..., ::step, :])
+            self._power_sum = power if self._power_sum is None else self._power_sum + power
+        self._segments += count
+        self._pending = samples[..., count * step:]
+
+    def _compute_power(self, segments):
+        # summed over segments; real signals keep non-negative half only
+        segments = (segments - np.mean(segments, axis=-1, keepdims=True)) * self._get_window()
+        if self._onesided:
+            transformed = np.fft.rfft(segments, n=self._get_fft_size(), axis=-1)
+        else:
+            transformed = np.fft.fft(segments, n=self._get_fft_size(), axis=-1)
+        return np.sum(transformed.real ** 2 + transformed.imag ** 2, axis=-2)
+
+    def _get_power(self):
+        # two-sided, zero frequency in the middle
+        power = self._power_sum
+        if self._onesided:
+            negative = power[..., 1:self._get_fft_size() - power.shape[-1] + 1][..., ::-1]
+            power = np.concatenate((power, negative), axis=-1)
+        return np.fft.fftshift(power, axes=-1)
+
+    def _get_overlap(self):
+        return self._segment_size // 2 if self._overlap is None else self._overlap
+
+    def _get_fft_size(self):
+        return self._segment_size if self._fft_size is None else self._fft_size
+
+    def _get_window(self):
+        if isinstance(self._window, np.ndarray):
+            return self._window
+        return signal.get_window(self._window, self._segment_size)
+
+    def __repr__(self):
+        return "SpectrumAnalyzer ({0})".format(self._segment_size)
@@ -1,21 +1,404 @@
 import numpy as np
 
-from blocks.meta import AbstractBlock
+from blocks.lazy import LazyModule
+from blocks.meta import AbstractBlock, append_samples
+
+signal = LazyModule('scipy.signal')
 
 
 class MultiPathChannel(AbstractBlock):
-    def __init__(self, delay=120, paths=5):
+    # above this many taps FFT overlap-add beats shifted adds
+    SPARSE_TAPS_LIMIT = 32
+    # shifted adds go chunk by chunk, keeping temporaries short
+    CHUNK_SIZE = 2 ** 16
+    # taps are drawn once, on construction and whenever seed changes
+    STOCHASTIC = True
+    STATIC_SIGNALS = ('impulse_response',)
+
+    def __init__(self, delay=120, paths=5, trials=None, seed=None):
         super(MultiPathChannel, self).__init__()
-        self._init_impulse_response(delay, paths)
+        self._delays = None
+        self._gains = None
+        self._length = 0
+        self._carrier_frequency = None
+        self._stream_history = None
+        self._layout = (delay, paths, trials)
+        self._seed = seed
+        self._init_impulse_response(delay, paths, trials)
+
+    def _reseed(self):
+        self._init_impulse_response(*self._layout)
 
-    def _init_impulse_response(self, delay, paths):
+    def _init_impulse_response(self, delay, paths, trials=None):
+        # with trials, every row of a batch gets its own path gains
         rng = 4
-        imp = np.zeros(delay * paths)
-        for p in range(paths):
-            val = 1 if p == 0 else np.random.randint(-rng, rng) / 10
-            imp[delay * p] = val
-        self._impulse_response = imp
+        shape = (paths - 1,) if trials is None else (trials, paths - 1)
+        echoes = self._make_random().integers(-rng, rng, size=shape) / 10
+        gains = np.concatenate((np.ones(shape[:-1] + (1,)), echoes), axis=-1)
+        used = np.any(gains != 0, axis=tuple(range(gains.ndim - 1)))
+        self._delays = delay * np.flatnonzero(used)
+        self._gains = gains[..., used]
+        self._length = delay * paths
+
+    @property
+    def delays(self):
+        return self._delays
+
+    @property
+    def gains(self):
+        return self._gains
+
+    @property
+    def parameters(self):
+        values = super(MultiPathChannel, self).parameters
+        values.update(delays=self._delays, gains=self._gains)
+        return values
+
+    @property
+    def recorded_signals(self):
+        signals = super(MultiPathChannel, self).recorded_signals
+        signals['impulse_response'] = self.impulse_response
+        return signals
+
+    @property
+    def carrier_frequency(self):
+        # needed in baseband only, where every path rotates envelope phase
+        return self._carrier_frequency
+
+    @carrier_frequency.setter
+    def carrier_frequency(self, freq):
+        if freq != self._carrier_frequency:
+            self._carrier_frequency = freq
+            self._invalidate()
+
+    @property
+    def impulse_response(self):
+        gains = self._get_envelope_gains()
+        imp = np.zeros(gains.shape[:-1] + (self._length,), dtype=gains.dtype)
+        imp[..., self._delays] = gains
+        return imp
+
+    def _compute(self):
+        self._output = self._apply_taps(self._input, batch=True)
+
+    def _reset_stream(self):
+        self._stream_history = None
+
+    def _compute_frame(self, frame):
+        history = self._stream_history
+        if history is None:
+            history = np.zeros(frame.shape[:-1] + (self._get_max_delay(),))
+        window = append_samples(history, frame)
+        self._stream_history = window[..., window.shape[-1] - history.shape[-1]:]
+        return self._apply_taps(window)[..., history.shape[-1]:]
+
+    def _apply_taps(self, samples, batch=False):
+        # Output is truncated to input length, like the dense convolution
+        # was. Only batch output may reuse a buffer, frames are handed on.
+        size = samples.shape[-1]
+        gains = self._get_envelope_gains()
+        if gains.shape[-1] > self.SPARSE_TAPS_LIMIT:
+            imp = self.impulse_response
+            ndim = max(samples.ndim, imp.ndim)
+            imp = imp.reshape((1,) * (ndim - imp.ndim) + imp.shape)
+            samples = samples.reshape((1,) * (ndim - samples.ndim) + samples.shape)
+            return signal.oaconvolve(samples, imp, axes=-1)[..., :size]
+        rows = np.broadcast(samples[..., :1], gains[..., :1]).shape[:-1]
+        dtype = self._get_dtype(np.iscomplexobj(samples) or np.iscomplexobj(gains))
+        gains = gains.astype(dtype, copy=False)
+        out = self._get_buffer('output', rows + (size,), dtype) if batch else np.empty(rows + (size,), dtype)
+        for start in range(0, size, self.CHUNK_SIZE):
+            chunk = out[..., start:start + self.CHUNK_SIZE]
+            stop = start + chunk.shape[-1]
+            chunk[...] = 0
+            for index, delay in enumerate(self._delays):
+                first = max(start, delay)
+                if first < stop:
+                    gain = gains[..., index, np.newaxis]
+                    chunk[..., first - start:] += gain * samples[..., first - delay:stop - delay]
+        return out
+
+    def _get_envelope_gains(self):
+        # path delayed by tau turns carrier phase by -omega tau
+        if not self._baseband:
+            return self._gains
+        omega = 2 * np.pi * self._carrier_frequency
+        return self._gains * np.exp(-1j * omega * self._delays * self._get_time_step())
+
+    def _get_max_delay(self):
+        return int(np.max(self._delays)) if self._delays.size else 0
+
+
+class FadingChannel(AbstractBlock):
+    # pylint: disable=too-many-instance-attributes
+    # Time-varying counterpart of MultiPathChannel. Path p, delayed by
+    # p * delay samples, has a complex gain made of `sinusoids` phasors
+    # Doppler shifted by doppler * cos(angle of arrival), with random angles
+    # spread around the circle and random phases (Jakes-like sum of
+    # sinusoids), so its envelope is Rayleigh. With rician_factor K above
+    # zero the first path gets a line of sight phasor holding K / (K + 1)
+    # of its power. Mean power falls by power_decay dB per path, summing
+    # to one. Gains depend on absolute sample number only, so streamed
+    # frames match batch output.
+    # Gains are evaluated on a table of GRID_POINTS_PER_PERIOD points per
+    # Doppler period and interpolated linearly in between, so their cost
+    # per sample does not grow with number of sinusoids.
+    # In passband, imaginary part of a gain acts on quadrature of signal,
+    # i.e. on signal delayed by a quarter of carrier period (rounded to
+    # whole samples), which holds for signals narrow around carrier.
+    STOCHASTIC = True
+    STATIC_SIGNALS = ('impulse_response',)
+    GRID_POINTS_PER_PERIOD = 1024
+    # grid cells at least this long are applied whole, see _apply_fading
+    CELL_SIZE_LIMIT = 2 ** 12
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, delay=120, paths=5, doppler=100.0, rician_factor=0.0, sinusoids=16, trials=None, seed=None):
+        # pylint: disable=too-many-arguments
+        super(FadingChannel, self).__init__()
+        self._delays = delay * np.arange(paths)
+        self._sinusoids = sinusoids
+        self._trials = trials
+        self._doppler = doppler
+        self._rician_factor = rician_factor
+        self._power_decay = 3.0
+        self._carrier_frequency = None
+        self._angles = None
+        self._phases = None
+        self._line_of_sight = None
+        self._stream_history = None
+        self._stream_offset = 0
+        self._seed = seed
+        self._init_fading()
+
+    def _reseed(self):
+        self._init_fading()
+
+    def _init_fading(self):
+        # with trials, every row of a batch fades on its own
+        random = self._make_random()
+        rows = () if self._trials is None else (self._trials,)
+        shape = rows + (self._delays.size, self._sinusoids)
+        offsets = random.uniform(-np.pi, np.pi, size=shape[:-1] + (1,))
+        self._angles = (2 * np.pi * np.arange(self._sinusoids) + offsets) / self._sinusoids
+        self._phases = random.uniform(-np.pi, np.pi, size=shape)
+        # angle of arrival and phase of line of sight
+        self._line_of_sight = random.uniform(-np.pi, np.pi, size=rows + (2,))
+
+    @property
+    def delays(self):
+        return self._delays
+
+    @property
+    def doppler(self):
+        # maximal Doppler shift [Hz], speed / wavelength
+        return self._doppler
+
+    @doppler.setter
+    def doppler(self, doppler):
+        if doppler != self._doppler:
+            self._doppler = doppler
+            self._invalidate()
+
+    @property
+    def rician_factor(self):
+        # power of line of sight to scattered power on first path, linear
+        return self._rician_factor
+
+    @rician_factor.setter
+    def rician_factor(self, factor):
+        if factor != self._rician_factor:
+            self._rician_factor = factor
+            self._invalidate()
+
+    @property
+    def power_decay(self):
+        # dB per path
+        return self._power_decay
+
+    @power_decay.setter
+    def power_decay(self, decay):
+        if decay != self._power_decay:
+            self._power_decay = decay
+            self._invalidate()
+
+    @property
+    def carrier_frequency(self):
+        # sets quadrature delay in passband and path rotation in baseband
+        return self._carrier_frequency
+
+    @carrier_frequency.setter
+    def carrier_frequency(self, freq):
+        if freq != self._carrier_frequency:
+            self._carrier_frequency = freq
+            self._invalidate()
+
+    @property
+    def path_powers(self):
+        powers = 10 ** (-self._power_decay * np.arange(self._delays.size) / 10)
+        return powers / np.sum(powers)
+
+    @property
+    def impulse_response(self):
+        # complex envelope one, at first sample
+        gains = self.get_gains(0, 1)[..., 0]
+        length = int(self._delays[-1]) + 1 if self._delays.size else 0
+        imp = np.zeros(gains.shape[:-1] + (length,), dtype=gains.dtype)
+        imp[..., self._delays] = gains
+        return imp
+
+    @property
+    def recorded_signals(self):
+        signals = super(FadingChannel, self).recorded_signals
+        signals['impulse_response'] = self.impulse_response
+        return signals
+
+    @property
+    def parameters(self):
+        values = super(FadingChannel, self).parameters
+        values.update(delays=self._delays, sinusoids=self._sinusoids, trials=self._trials)
+        return values
+
+    def get_gains(self, start, stop):
+        # Complex envelope gains of paths at samples start..stop - 1,
+        # shaped (trials, paths, samples) or (paths, samples).
+        step = self._get_grid_step()
+        first, last = start // step, (stop - 1) // step
+        return self._interpolate(self._get_gain_table(first, last + 1), first * step, start, stop)
+
+    def _interpolate(self, table, origin, start, stop):
+        # Linear between grid points of table, first of them at sample
+        # origin. Grid cells are filled by broadcasting, not by gathering
+        # values sample by sample, which is several times faster.
+        step = self._get_grid_step()
+        slopes = np.diff(table, axis=-1)
+        if stop - start <= step:
+            # at most two cells, gathered per sample
+            offsets = np.arange(start, stop) - origin
+            cells = offsets // step
+            gains = slopes[..., cells] * ((offsets - cells * step) / step)
+            gains += table[..., cells]
+            return gains
+        gains = slopes[..., np.newaxis] * (np.arange(step) / step)
+        gains += table[..., :-1, np.newaxis]
+        gains = gains.reshape(gains.shape[:-2] + (-1,))
+        return gains[..., start - origin:stop - origin]
+
+    def _get_gain_table(self, first, last):
+        # gains at grid points first..last, from their phasors
+        times = np.arange(first, last + 1) * (self._get_grid_step() * self._get_time_step())
+        omega = 2 * np.pi * self._doppler
+        frequencies = omega * np.cos(self._angles)
+        phasors = np.exp(1j * (frequencies[..., np.newaxis] * times + self._phases[..., np.newaxis]))
+        table = np.sum(phasors, axis=-2) / np.sqrt(self._sinusoids)
+        if self._rician_factor > 0 and table.shape[-2]:
+            factor = self._rician_factor
+            angle, phase = self._line_of_sight[..., 0:1], self._line_of_sight[..., 1:2]
+            line_of_sight = np.exp(1j * (omega * np.cos(angle) * times + phase))
+            table[..., 0, :] *= np.sqrt(1 / (factor + 1))
+            table[..., 0, :] += np.sqrt(factor / (factor + 1)) * line_of_sight
+        table *= np.sqrt(self.path_powers)[:, np.newaxis]
+        if self._baseband:
+            # path delayed by tau turns carrier phase by -omega tau
+            rotation = np.exp(-2j * np.pi * self._carrier_frequency * self._delays * self._get_time_step())
+            table *= rotation[:, np.newaxis]
+        return table
+
+    def _get_grid_step(self):
+        # samples between grid points; gains without Doppler are constant
+        if self._doppler <= 0:
+            return self.CHUNK_SIZE
+        return max(1, int(self._sampling_frequency / (self._doppler * self.GRID_POINTS_PER_PERIOD)))
+
+    def _get_quadrature_delay(self):
+        if self._baseband:
+            return 0
+        if not self._carrier_frequency:
+            raise ValueError("Carrier frequency has to be set for passband fading.")
+        return int(round(self._sampling_frequency / (4 * self._carrier_frequency)))
 
     def _compute(self):
-        out = np.convolve(self._impulse_response, self._input)
-        self._output = out[0:self._input.size]
+        samples = self._input
+        rows = np.broadcast(samples[..., :1], self._phases[..., 0, :1]).shape[:-1]
+        out = self._get_buffer('output', rows + (samples.shape[-1],), self._get_dtype(self._baseband))
+        self._output = self._apply_fading(samples, 0, 0, out)
+
+    def _reset_stream(self):
+        self._stream_history = None
+        self._stream_offset = 0
+
+    def _compute_frame(self, frame):
+        # frames are handed on, never reuse buffers for them
+        start = self._stream_offset
+        window = append_samples(self._stream_history, frame)
+        base = start - (window.shape[-1] - frame.shape[-1])
+        rows = np.broadcast(frame[..., :1], self._phases[..., 0, :1]).shape[:-1]
+        out = np.empty(rows + (frame.shape[-1],), self._get_dtype(self._baseband))
+        self._apply_fading(window, base, start, out)
+        history = int(self._delays[-1]) + self._get_quadrature_delay() if self._delays.size else 0
+        self._stream_history = window[..., max(0, window.shape[-1] - history):]
+        self._stream_offset = start + frame.shape[-1]
+        return out
+
+    def _apply_fading(self, window, base, start, out):
+        # Fills out with output at samples start.. (absolute numbers); window
+        # holds input from sample base on, earlier input is zero. Chunks end
+        # on grid points. Within a long grid cell, gain of a path is a + s f
+        # for fraction f of the cell, so sums of a x and s x over paths are
+        # scalar multiply-adds like in MultiPathChannel and f is applied once.
+        # Short cells (high Doppler) get per sample gains instead.
+        quadrature = self._get_quadrature_delay()
+        step = self._get_grid_step()
+        whole_cells = step >= self.CELL_SIZE_LIMIT
+        cells = 1 if whole_cells else max(1, self.CHUNK_SIZE // step)
+        stop = start + out.shape[-1]
+        chunk_start = start
+        while chunk_start < stop:
+            first = chunk_start // step
+            chunk_stop = min(stop, chunk_start + self.CHUNK_SIZE, (first + cells) * step)
+            chunk = out[..., chunk_start - start:chunk_stop - start]
+            chunk[...] = 0
+            table = self._get_gain_table(first, (chunk_stop - 1) // step + 1)
+            if whole_cells:
+                sloped = np.zeros_like(chunk)
+            for gains, shift in self._split_gains(table, quadrature):
+                if whole_cells:
+                    slopes = gains[..., 1:2] - gains[..., 0:1]
+                    gains = gains[..., 0:1]
+                else:
+                    gains = self._interpolate(gains, first * step, chunk_start, chunk_stop)
+                for index, delay in enumerate(self._delays):
+                    if whole_cells:
+                        self._add_path(sloped, slopes[..., index, :], window, base, chunk_start, delay + shift)
+                    self._add_path(chunk, gains[..., index, :], window, base, chunk_start, delay + shift)
+            if whole_cells:
+                sloped *= (np.arange(chunk_start, chunk_stop) - first * step) / step
+                chunk += sloped
+            chunk_start = chunk_stop
+        return out
+
+    def _split_gains(self, table, quadrature):
+        # (gains, extra delay) pairs; in passband real parts of gains act on
+        # signal, imaginary ones on its quadrature
+        if self._baseband:
+            return [(table, 0)]
+        return [(table.real, 0), (-table.imag, quadrature)]
+
+    @staticmethod
+    def _add_path(chunk, gain, window, base, start, delay):
+        # chunk += gain * input delayed, input before sample 0 is zero;
+        # gain is one per row or per sample, the latter is overwritten
+        first = max(start, delay)
+        stop = start + chunk.shape[-1]
+        if first < stop:
+            delayed = window[..., first - delay - base:stop - delay - base]
+            if gain.shape[-1] == chunk.shape[-1]:
+                gain = gain[..., first - start:]
+            if gain.shape == delayed.shape:
+                np.multiply(gain, delayed, out=gain)
+                chunk[..., first - start:] += gain
+            else:
+                chunk[..., first - start:] += gain * delayed
+
+    def __repr__(self):
+        return "FadingChannel ({0} paths, Doppler {1}Hz)".format(self._delays.size, self._doppler)
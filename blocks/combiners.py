@@ -0,0 +1,55 @@
+from blocks.meta import AbstractBlock
+
+
+class Combiner(AbstractBlock):  # pylint: disable=abstract-method
+    # Weighted sum of signals on named input ports, e.g. diversity branches.
+    # Longer signals are cut to the shortest one. Works on whole signals
+    # only, frames of its ports are not aligned.
+    STREAMING = False
+
+    def __init__(self, ports=('input', 'other'), weights=None):
+        super(Combiner, self).__init__()
+        self._ports = tuple(ports)
+        self._signals = dict.fromkeys(self._ports)
+        self._weights = None
+        self.weights = weights
+
+    @property
+    def input_ports(self):
+        return self._ports
+
+    @property
+    def weights(self):
+        # None sums all ports with unit weights
+        return self._weights
+
+    @weights.setter
+    def weights(self, weights):
+        if weights is not None:
+            weights = tuple(weights)
+            if len(weights) != len(self._ports):
+                e = "Expected {0} weights. Found {1}".format(len(self._ports), len(weights))
+                raise ValueError(e)
+        if weights != self._weights:
+            self._weights = weights
+            self._invalidate()
+
+    def get_port(self, port):
+        return self._signals[port]
+
+    def _store_port(self, port, value):
+        self._signals[port] = value
+        if port == self._ports[0]:
+            self._input = value
+
+    def _compute(self):
+        signals = [self._signals[port] for port in self._ports]
+        if any(samples is None for samples in signals):
+            raise ValueError("Every port of {0} has to be connected.".format(self))
+        length = min(samples.shape[-1] for samples in signals)
+        weights = self._weights or (1,) * len(signals)
+        self._output = sum(weight * samples[..., :length]
+                           for weight, samples in zip(weights, signals))
+
+    def __repr__(self):
+        return "Combiner ({0})".format(", ".join(self._ports))
@@ -0,0 +1,273 @@
+import collections
+import math
+import threading
+
+import numpy as np
+
+from blocks.lazy import LazyModule
+
+signal = LazyModule('scipy.signal')
+
+
+class FilterDesignCache(object):
+    # Least recently used designs are dropped once max_size is exceeded.
+    # Cached arrays are shared, so they are returned read-only.
+    def __init__(self, max_size=256):
+        self._designs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._designs)
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, size):
+        with self._lock:
+            self._max_size = size
+            self._evict()
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def butter(self, order, cutoffs, btype, output='ba'):
+        key = ('butter', order, tuple(np.atleast_1d(cutoffs).tolist()),
+               btype, output)
+        with self._lock:
+            if key in self._designs:
+                self._hits += 1
+                self._designs.move_to_end(key)
+                return self._designs[key]
+            self._misses += 1
+        design = self._freeze(signal.butter(order, cutoffs, btype=btype,
+                                            output=output, analog=False))
+        with self._lock:
+            self._designs[key] = design
+            self._evict()
+        return design
+
+    def clear(self):
+        with self._lock:
+            self._designs.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def _evict(self):
+        while len(self._designs) > self._max_size:
+            self._designs.popitem(last=False)
+
+    @staticmethod
+    def _freeze(design):
+        arrays = design if isinstance(design, tuple) else (design,)
+        for array in arrays:
+            array.setflags(write=False)
+        return design
+
+
+cache = FilterDesignCache()
+
+
+def butter(order, cutoffs, btype='low', output='ba'):
+    # output='sos' stores second-order sections instead of (b, a)
+    return cache.butter(order, cutoffs, btype, output)
+
+
+def is_sos(design):
+    return not isinstance(design, tuple)
+
+
+def apply(design, samples, state=None):
+    # filters along last axis; with state given returns (output, final state)
+    if is_sos(design):
+        design = np.array(design)  # sosfilt refuses read-only cached sections
+        if state is None:
+            return signal.sosfilt(design, samples)
+        return signal.sosfilt(design, samples, zi=state)
+    b, a = design
+    if state is None:
+        return signal.lfilter(b, a, samples)
+    return signal.lfilter(b, a, samples, zi=state)
+
+
+def apply_in_place(design, samples, chunk_size=2 ** 16):
+    # Same as apply, but filtered chunk by chunk back into samples, so no
+    # full length temporaries are made, e.g. in float64 for float32 input.
+    state = zero_state(design, samples.shape[:-1])
+    for start in range(0, samples.shape[-1], chunk_size):
+        chunk = samples[..., start:start + chunk_size]
+        chunk[...], state = apply(design, chunk, state)
+    return samples
+
+
+def apply_zero_phase(design, samples):
+    if is_sos(design):
+        return signal.sosfiltfilt(np.array(design), samples)
+    return signal.filtfilt(design[0], design[1], samples)
+
+
+def zero_state(design, rows=()):
+    # rows is shape of filtered samples without time axis
+    if is_sos(design):
+        return np.zeros((design.shape[0],) + tuple(rows) + (2,))
+    b, a = design
+    return np.zeros(tuple(rows) + (max(len(a), len(b)) - 1,))
+
+
+def state_rows(design, state):
+    # inverse of zero_state: shape of filtered samples without time axis
+    if is_sos(design):
+        return state.shape[1:-1]
+    return state.shape[:-1]
+
+
+def steady_state(design, first):
+    # state of a filter fed with constant `first` (..., 1) since forever
+    if is_sos(design):
+        initial = signal.sosfilt_zi(design)
+        shape = (design.shape[0],) + (1,) * (first.ndim - 1) + (2,)
+        return initial.reshape(shape) * first[np.newaxis]
+    return signal.lfilter_zi(*design) * first
+
+
+def pad_length(design):
+    # default padlen of signal.filtfilt and signal.sosfiltfilt
+    if is_sos(design):
+        zeros = min((design[:, 2] == 0).sum(), (design[:, 5] == 0).sum())
+        return 3 * (2 * design.shape[0] + 1 - zeros)
+    return 3 * max(len(design[0]), len(design[1]))
+
+
+def frequency_response(design, points=512):
+    if is_sos(design):
+        return signal.sosfreqz(design, worN=points)
+    return signal.freqz(design[0], design[1], worN=points)
+
+
+def group_delay(design, omega):
+    # in samples, at normalized angular frequency omega [rad/sample]
+    step = 1e-6 * np.pi
+    _, response = frequency_response(design, [omega - step, omega + step])
+    phase = np.unwrap(np.angle(response))
+    return -(phase[1] - phase[0]) / (2 * step)
+
+
+def impulse_response(design, length):
+    impulse = np.zeros(length)
+    impulse[0] = 1
+    return apply(design, impulse)
+
+
+class StreamResampler(object):
+    # Frame by frame counterpart of signal.resample_poly(x, up, down) with
+    # its default Kaiser window and zero padding: outputs of process() and
+    # flush() put together equal resample_poly of frames put together.
+    # An output sample needs half_len upsampled samples of future input,
+    # so output lags behind input by that much until flush.
+    def __init__(self, up, down):
+        divisor = math.gcd(up, down)
+        self._up, self._down = up // divisor, down // divisor
+        max_rate = max(self._up, self._down)
+        self._half_len = 10 * max_rate
+        self._taps = None
+        if max_rate > 1:
+            self._taps = signal.firwin(2 * self._half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0)) * self._up
+        self._pending = None
+        self._start = self._get_start(0)  # input sample number of pending[0]
+        self._received = 0
+        self._emitted = 0
+
+    def process(self, samples):
+        self._received += samples.shape[-1]
+        if self._pending is None:
+            # input before sample 0 is zero
+            self._pending = np.zeros(samples.shape[:-1] + (-self._start,), samples.dtype)
+        self._pending = np.concatenate((self._pending, samples), axis=-1)
+        # last input sample needed by output n is (n * down + half_len) // up
+        last = max(0, ((self._received - 1) * self._up - self._half_len) // self._down + 1)
+        return self._emit(last)
+
+    def flush(self):
+        if self._pending is None:
+            return np.zeros(0)
+        last = -(-self._received * self._up // self._down)
+        needed = (max(last - 1, 0) * self._down + self._half_len) // self._up + 1 - self._start
+        missing = needed - self._pending.shape[-1]
+        if missing > 0:
+            # input after its end is zero
+            zeros = np.zeros(self._pending.shape[:-1] + (missing,), self._pending.dtype)
+            self._pending = np.concatenate((self._pending, zeros), axis=-1)
+        return self._emit(last)
+
+    def _emit(self, last):
+        count = last - self._emitted
+        if count <= 0:
+            return self._pending[..., :0]
+        if self._up == self._down:
+            out = self._pending[..., self._emitted - self._start:last - self._start]
+        else:
+            # upfirdn output j is output n where start * up + j * down = n * down + half_len
+            first = (self._emitted * self._down + self._half_len - self._start * self._up) // self._down
+            stop = ((last - 1) * self._down + self._half_len) // self._up + 1 - self._start
+            out = signal.upfirdn(self._taps, self._pending[..., :stop], self._up, self._down, axis=-1)
+            out = out[..., first:first + count]
+        self._emitted = last
+        start = self._get_start(last)
+        self._pending = self._pending[..., start - self._start:]
+        self._start = start
+        return out
+
+    def _get_start(self, output):
+        # First input sample needed by output, moved back so that
+        # start * up - half_len is a multiple of down, which keeps
+        # upfirdn outputs on the output grid.
+        if self._up == self._down:
+            return output
+        start = -((self._half_len - output * self._down) // self._up)
+        if self._down > 1:
+            start -= (start * self._up - self._half_len) * pow(self._up, -1, self._down) % self._down
+        return start
+
+
+class DesignedFilterMixin(object):
+    # Filter structure options shared by blocks designing Butterworth
+    # filters. Second-order sections stay accurate for cutoffs of a few
+    # percent of Nyquist, where (b, a) runs out of float64 precision.
+    def __init__(self):
+        super(DesignedFilterMixin, self).__init__()
+        self._filter_order = 4
+        self._filter_output = 'ba'
+
+    @property
+    def filter_order(self):
+        return self._filter_order
+
+    @filter_order.setter
+    def filter_order(self, order):
+        if order != self._filter_order:
+            self._filter_order = order
+            self._invalidate()
+
+    @property
+    def filter_output(self):
+        return self._filter_output
+
+    @filter_output.setter
+    def filter_output(self, output):
+        if output not in ('ba', 'sos'):
+            raise ValueError("Filter output {0} is neither 'ba' nor 'sos'.".format(output))
+        if output != self._filter_output:
+            self._filter_output = output
+            self._invalidate()
+
+    def _design_butter(self, cutoffs, btype):
+        return butter(self._filter_order, cutoffs, btype, self._filter_output)
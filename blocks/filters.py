@@ -1,28 +1,159 @@
-import scipy.signal as signal
+import logging
 
-from blocks.meta import AbstractBlock
+import numpy as np
 
+from blocks import designs
+from blocks.lazy import LazyModule
+from blocks.meta import AbstractBlock, append_samples
+
+signal = LazyModule('scipy.signal')
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class BandPassFilter(designs.DesignedFilterMixin, AbstractBlock):
+    # Backward pass of a streamed filtfilt starts this many samples after
+    # the emitted ones, where initial state error has decayed below it.
+    STREAM_SETTLING_TOLERANCE = 1e-12
+    STREAM_SETTLING_MAX = 2 ** 16
+    STATIC_SIGNALS = ('design',)
 
-class BandPassFilter(AbstractBlock):
     def __init__(self):
         super(BandPassFilter, self).__init__()
         self._freqs = None
-        self._b = None
-        self._a = None
+        self._causal = False
+        self._compensate_delay = False
+        self._design = None
+        self._stream_delay = 0
+        self._stream_state = None
+        self._stream_head = None
+        self._stream_tail = None
+        self._stream_pending = None
+        self._stream_lookahead = None
 
     def _compute(self):
         self._compute_filter_coefficients()
-        self._output = signal.filtfilt(self._b, self._a, self._input)
+        if self._causal:
+            self._output = self._compute_causal(self._input)
+        else:
+            self._output = designs.apply_zero_phase(self._design, self._input)
+
+    def _compute_causal(self, samples):
+        # Without delay compensation state is kept between calls, so
+        # consecutive inputs are filtered as one continuous signal. With it,
+        # every input is a standalone signal, filtered from zero state and
+        # shifted back by group delay, completed as if it ended with zeros.
+        initial = self._get_zero_state(samples)
+        if (self._compensate_delay or self._stream_state is None
+                or self._stream_state.shape != initial.shape):
+            self._stream_state = initial
+        out, self._stream_state = designs.apply(self._design, samples,
+                                                self._stream_state)
+        if not self._compensate_delay:
+            return out
+        delay = min(self.group_delay, samples.shape[-1])
+        zeros = np.zeros(samples.shape[:-1] + (delay,), self._get_dtype(np.iscomplexobj(samples)))
+        tail, _ = designs.apply(self._design, zeros, self._stream_state)
+        return np.concatenate((out[..., delay:], tail), axis=-1)
 
     def _compute_filter_coefficients(self):
-        filter_order = 4
         cutoff_omegas = self._get_normalized_cutoff_omegas()
-        print("Filter cutoff omegas", cutoff_omegas)
-        coefficients = signal.butter(filter_order, cutoff_omegas,
-                                     output='ba', btype='bandpass',
-                                     analog=False)
-        self._b = coefficients[0]
-        self._a = coefficients[1]
+        logger.debug("Filter cutoff omegas %s", cutoff_omegas)
+        design = self._design_butter(cutoff_omegas, 'low' if self._baseband else 'bandpass')
+        if design is not self._design:
+            self._stream_state = None
+        self._design = design
+
+    def _reset_stream(self):
+        self._compute_filter_coefficients()
+        self._stream_state = None
+        self._stream_head = None
+        self._stream_tail = None
+        self._stream_pending = None
+        self._stream_lookahead = self._compute_settling_samples()
+        self._stream_delay = self.group_delay if self._compensate_delay else 0
+
+    def _compute_frame(self, frame):
+        if self._causal:
+            return self._compute_causal_frame(frame)
+        # Zero-phase filtering emulated on frames: forward pass is carried
+        # exactly, backward pass is restarted on every frame far enough
+        # in the future for its transient to vanish.
+        if self._stream_state is None:
+            frame = self._start_stream(frame)
+            if frame is None:
+                return np.zeros(0)
+        forward, self._stream_state = designs.apply(self._design, frame,
+                                                    self._stream_state)
+        tail = append_samples(self._stream_tail, frame)
+        self._stream_tail = tail[..., -(designs.pad_length(self._design) + 1):]
+        self._stream_pending = append_samples(self._stream_pending, forward)
+        count = self._stream_pending.shape[-1] - self._stream_lookahead
+        if count <= 0:
+            return frame[..., :0]
+        out = self._filter_backward(self._stream_pending)[..., :count]
+        self._stream_pending = self._stream_pending[..., count:]
+        return out
+
+    def _compute_causal_frame(self, frame):
+        if self._stream_state is None:
+            self._stream_state = self._get_zero_state(frame)
+        out, self._stream_state = designs.apply(self._design, frame,
+                                                self._stream_state)
+        # compensated output starts group delay later, see _flush_stream
+        skipped = min(self._stream_delay, out.shape[-1])
+        self._stream_delay -= skipped
+        return out[..., skipped:]
+
+    def _flush_causal_stream(self):
+        if self._stream_state is None or not self._compensate_delay:
+            return np.zeros(0)
+        rows = designs.state_rows(self._design, self._stream_state)
+        zeros = np.zeros(rows + (self.group_delay - self._stream_delay,),
+                         self._get_dtype(np.iscomplexobj(self._stream_state)))
+        out, self._stream_state = designs.apply(self._design, zeros,
+                                                self._stream_state)
+        return out
+
+    def _flush_stream(self):
+        if self._causal:
+            return self._flush_causal_stream()
+        if self._stream_state is None:
+            if self._stream_head is None:
+                return np.zeros(0)
+            return designs.apply_zero_phase(self._design, self._stream_head)
+        # same odd extension of signal end as signal.filtfilt does
+        pad_length = designs.pad_length(self._design)
+        tail = self._stream_tail
+        extension = 2 * tail[..., -1:] - tail[..., -2:-(pad_length + 2):-1]
+        forward, _ = designs.apply(self._design, extension, self._stream_state)
+        count = self._stream_pending.shape[-1]
+        pending = append_samples(self._stream_pending, forward)
+        self._stream_pending = None
+        return self._filter_backward(pending)[..., :count]
+
+    def _start_stream(self, frame):
+        head = append_samples(self._stream_head, frame)
+        pad_length = designs.pad_length(self._design)
+        if head.shape[-1] <= pad_length:
+            self._stream_head = head
+            return None
+        # same odd extension of signal start as signal.filtfilt does
+        extension = 2 * head[..., :1] - head[..., pad_length:0:-1]
+        initial = designs.steady_state(self._design, extension[..., :1])
+        _, self._stream_state = designs.apply(self._design, extension, initial)
+        self._stream_head = None
+        return head
+
+    def _filter_backward(self, forward):
+        initial = designs.steady_state(self._design, forward[..., -1:])
+        backward, _ = designs.apply(self._design, forward[..., ::-1], initial)
+        return backward[..., ::-1]
+
+    def _compute_settling_samples(self):
+        response = np.abs(designs.impulse_response(self._design, self.STREAM_SETTLING_MAX))
+        significant = response > self.STREAM_SETTLING_TOLERANCE * np.max(response)
+        return np.flatnonzero(significant)[-1] + 1
 
     @property
     def freqs(self):
@@ -34,10 +165,64 @@ class BandPassFilter(AbstractBlock):
             self._freqs = freqs
             self._invalidate()
 
+    @property
+    def causal(self):
+        return self._causal
+
+    @causal.setter
+    def causal(self, causal):
+        if causal != self._causal:
+            self._causal = causal
+            self._stream_state = None
+            self._invalidate()
+
+    @property
+    def compensate_delay(self):
+        return self._compensate_delay
+
+    @compensate_delay.setter
+    def compensate_delay(self, compensate):
+        if compensate != self._compensate_delay:
+            self._compensate_delay = compensate
+            self._invalidate()
+
+    @property
+    def group_delay(self):
+        # in samples, at band center; zero-phase filtering has none
+        if not self._causal:
+            return 0
+        if self._design is None:
+            self._compute_filter_coefficients()
+        center = 0 if self._baseband else 2 * np.pi * np.mean(self._freqs) / self._sampling_frequency
+        return int(round(designs.group_delay(self._design, center)))
+
+    @property
+    def stream_lookahead(self):
+        # samples a zero-phase stream holds back for its backward pass
+        return 0 if self._causal else self._stream_lookahead
+
+    @property
+    def design(self):
+        return self._design
+
+    @property
+    def recorded_signals(self):
+        signals = super(BandPassFilter, self).recorded_signals
+        signals['design'] = self._design
+        return signals
+
     @property
     def coefficients(self):
-        return self._b, self._a
+        if designs.is_sos(self._design):
+            return signal.sos2tf(self._design)
+        return self._design
+
+    def _get_zero_state(self, samples):
+        return designs.zero_state(self._design, samples.shape[:-1])
 
     def _get_normalized_cutoff_omegas(self):
+        if self._baseband:
+            # band is centred at zero frequency of the complex envelope
+            return (self._freqs[1] - self._freqs[0]) / self._sampling_frequency
         return [2 * f / self._sampling_frequency
                 for f in self._freqs]
@@ -1,7 +1,11 @@
+import logging
+
 import numpy as np
-from scipy import signal
 
-from blocks.meta import AbstractBlock
+from blocks import designs
+from blocks.meta import AbstractBlock, get_peak
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
 class Generator(AbstractBlock):
@@ -52,6 +56,12 @@ class Generator(AbstractBlock):
             self._offset = offset
             self._invalidate()
 
+    @property
+    def recorded_signals(self):
+        signals = super(Generator, self).recorded_signals
+        signals['input'] = self._input  # timeline
+        return signals
+
     def _compute(self):
         self._compute_time()
         self._compute_signal()
@@ -64,8 +74,27 @@ class Generator(AbstractBlock):
         self._input = np.arange(start, stop, step)
 
     def _compute_signal(self):
+        self._output = self._compute_frame(self._input)
+
+    def _compute_frame(self, frame):
+        # Generators get a frame of the timeline, i.e. times [s] of the
+        # samples to generate, and return those samples.
         raise NotImplementedError
 
+    def frames(self, frame_size):
+        self.reset_stream()
+        step = 1.0 / self._sampling_frequency
+        samples_count = self._get_samples_count()
+        for start in range(0, samples_count, frame_size):
+            stop = min(start + frame_size, samples_count)
+            time = np.arange(start, stop) * step
+            yield time, self.process_frame(time)
+
+    def _get_samples_count(self):
+        # same rounding as np.arange used by _compute_time
+        step = 1.0 / self._sampling_frequency
+        return int(np.ceil(self._generation_time / step))
+
 
 class OscillatingGenerator(Generator):
     def __init__(self):
@@ -82,15 +111,15 @@ class OscillatingGenerator(Generator):
             self._frequency = frequency
             self._invalidate()
 
-    def _compute_signal(self):
+    def _compute_frame(self, frame):
         raise NotImplementedError
 
 
 class SineGenerator(OscillatingGenerator):
-    def _compute_signal(self):
+    def _compute_frame(self, frame):
         omega = 2 * np.pi * self._frequency
-        sine = np.sin(omega * self._input)
-        self._output = self._amplitude * sine + self._offset
+        sine = np.sin(omega * frame)
+        return self._amplitude * sine + self._offset
 
     def __repr__(self):
         return "Sine Generator ({0}Hz)".format(self._frequency)
@@ -101,10 +130,10 @@ class SquareGenerator(OscillatingGenerator):
         super(SquareGenerator, self).__init__()
         self.__offset = -0.5
 
-    def _compute_signal(self):
+    def _compute_frame(self, frame):
         step = 1 / self._frequency
-        square = (self._input % step < (step / 2)).astype(float)
-        self._output = self._amplitude * square + self.__offset
+        square = (frame % step < (step / 2)).astype(float)
+        return self._amplitude * square + self.__offset
 
     def __repr__(self):
         return "Square Generator ({0}Hz)".format(self._frequency)
@@ -115,23 +144,61 @@ class SawGenerator(OscillatingGenerator):
         super(SawGenerator, self).__init__()
         self.__offset = -0.5
 
-    def _compute_signal(self):
-        saw = (self._input % (1 / self._frequency)) * self._frequency
-        self._output = self._amplitude * saw + self.__offset
+    def _compute_frame(self, frame):
+        saw = (frame % (1 / self._frequency)) * self._frequency
+        return self._amplitude * saw + self.__offset
 
     def __repr__(self):
         return "Saw Generator ({0}Hz)".format(self._frequency)
 
 
 class NoiseGenerator(Generator):
+    STOCHASTIC = True
+
+    def __init__(self):
+        super(NoiseGenerator, self).__init__()
+        self._trials = None
+        self._random = None
+        self._stream_seed = None
+
+    @property
+    def trials(self):
+        # None gives a single 1-D realisation, otherwise one row per trial
+        return self._trials
+
+    @trials.setter
+    def trials(self, trials):
+        if trials != self._trials:
+            self._trials = trials
+            self._invalidate()
+
     def _compute_signal(self):
-        self._output = np.random.normal(size=self._input.size)
+        self._random = self._make_random()
+        super(NoiseGenerator, self)._compute_signal()
+
+    def _reset_stream(self):
+        # concrete seed even without one set, so the stream can be replayed
+        self._stream_seed = np.random.SeedSequence() if self._seed is None else self._seed
+        self._random = self._make_random(self._stream_seed)
+
+    def _compute_frame(self, frame):
+        return self._draw_noise(frame.size, self._random)
+
+    def _draw_noise(self, size, random):
+        shape = size if self._trials is None else (self._trials, size)
+        # drawn in float64 and cast, since numpy draws float32 with another
+        # algorithm; realisations of a seed match at every precision
+        return random.standard_normal(shape).astype(self._dtype, copy=False)
+
 
+class BandNoiseGenerator(designs.DesignedFilterMixin, NoiseGenerator):
+    CALIBRATION_FRAME_SIZE = 2 ** 16
 
-class BandNoiseGenerator(NoiseGenerator):
     def __init__(self):
         super(BandNoiseGenerator, self).__init__()
         self._bandwidth = 0.01
+        self._stream_state = None
+        self._stream_peak = None
 
     @property
     def bandwidth(self):
@@ -144,11 +211,47 @@ class BandNoiseGenerator(NoiseGenerator):
             self._invalidate()
 
     def _compute_signal(self):
-        super(BandNoiseGenerator, self)._compute_signal()
-        print("_get_normalized_bw: ", self._get_normalized_bw())
-        b, a = signal.butter(4, self._get_normalized_bw(), btype='low', analog=False)
-        self._output = signal.lfilter(b, a, self._output)
-        self._output = self._output / np.max(np.abs(self._output))
+        logger.debug("Normalized bandwidth %s", self._get_normalized_bw())
+        design = self._get_filter_coefficients()
+        output = designs.apply_in_place(design, self._draw_noise(self._input.size, self._make_random()))
+        output /= get_peak(output)
+        self._output = output
+
+    def _reset_stream(self):
+        super(BandNoiseGenerator, self)._reset_stream()
+        self._stream_peak = self._find_stream_peak()
+        self._stream_state = self._get_initial_filter_state()
+
+    def _compute_frame(self, frame):
+        design = self._get_filter_coefficients()
+        noise = self._draw_noise(frame.size, self._random)
+        out, self._stream_state = designs.apply(design, noise,
+                                                self._stream_state)
+        return out / self._stream_peak
+
+    def _find_stream_peak(self):
+        # Batch output is normalized by its peak, which is only known once
+        # the whole signal exists. Dry-run the noise source to find it in
+        # constant memory, from a generator made of the same seed as the
+        # one real frames draw from.
+        random = self._make_random(self._stream_seed)
+        design = self._get_filter_coefficients()
+        state = self._get_initial_filter_state()
+        peak = 0
+        remaining = self._get_samples_count()
+        while remaining > 0:
+            size = min(remaining, self.CALIBRATION_FRAME_SIZE)
+            out, state = designs.apply(design, self._draw_noise(size, random), state)
+            peak = np.maximum(peak, get_peak(out))
+            remaining -= size
+        return peak
+
+    def _get_filter_coefficients(self):
+        return self._design_butter(self._get_normalized_bw(), 'low')
+
+    def _get_initial_filter_state(self):
+        rows = () if self._trials is None else (self._trials,)
+        return designs.zero_state(self._get_filter_coefficients(), rows)
 
     def _get_normalized_bw(self):
         return self._bandwidth / self._sampling_frequency
@@ -0,0 +1,20 @@
+import importlib
+
+
+class LazyModule(object):
+    # pylint: disable=too-few-public-methods
+    # Stands for a module imported on first attribute access. scipy.signal
+    # alone takes most of startup time, so blocks load it only when they
+    # really design or apply a filter; freshly spawned workers and short
+    # headless jobs do not pay for what they never use.
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return "LazyModule ({0})".format(self._name)
@@ -1,14 +1,74 @@
 import abc
+import logging
+
+import numpy as np
+
+from blocks.profiling import BlockProfile
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def append_samples(samples, frame):
+    # joins along time axis, None stands for no samples collected yet
+    if samples is None:
+        return frame
+    return np.concatenate((samples, frame), axis=-1)
+
+
+def get_peak(samples):
+    # max of |samples| along time axis, without an array of absolute values
+    peak = np.max(samples, axis=-1, keepdims=True)
+    return np.maximum(peak, -np.min(samples, axis=-1, keepdims=True))
+
+
+def fingerprint(samples, count=1024):
+    # Cheap content digest: shape, dtype and hash of at most about `count`
+    # evenly strided samples. Catches arrays refilled in place, not every
+    # single changed sample.
+    if not isinstance(samples, np.ndarray):
+        return None
+    step = max(1, samples.size // count)
+    return samples.shape, samples.dtype.str, hash(samples.flat[::step].tobytes())
+
+
+def get_seed_key(seed):
+    # SeedSequence has no equality, compare what it was made of
+    if isinstance(seed, np.random.SeedSequence):
+        return seed.entropy, tuple(seed.spawn_key)
+    return seed
 
 
 class AbstractBlock(object):
     __metaclass__ = abc.ABCMeta
+    # Stochastic blocks draw from their own np.random.Generator, made from
+    # `seed` anew for every computation, so output depends on inputs,
+    # parameters and seed only. No seed means fresh OS entropy each time.
+    STOCHASTIC = False
+    # blocks which need whole signals, e.g. from several ports, set it off
+    # and System.stream rejects them
+    STREAMING = True
+    # attributes a signal store records from streamed runs besides output:
+    # frame ones describe the last frame and are appended after every one,
+    # static ones are saved once the stream ends
+    FRAME_SIGNALS = ()
+    STATIC_SIGNALS = ()
+    # settable properties which are not simulation parameters
+    NON_PARAMETERS = ('input', 'profiling', 'fingerprint_input', 'in_place')
 
     def __init__(self):
         self._input = None
         self._output = None
         self._sampling_frequency = 0
+        self._baseband = False
         self._is_valid = False
+        self._version = 0
+        self._port_tags = {}
+        self._fingerprint_input = False
+        self._profile = None
+        self._seed = None
+        self._dtype = np.dtype(np.float64)
+        self._in_place = False
+        self._buffers = {}
 
     @property
     def input(self):
@@ -16,16 +76,112 @@ class AbstractBlock(object):
 
     @input.setter
     def input(self, value):
-        if value != self._input:
-            self._input = value
+        self.set_input(value)
+
+    @property
+    def input_ports(self):
+        # names of inputs System can connect other blocks to; first is input
+        return ('input',)
+
+    def set_input(self, value, version=None):
+        self.set_port(self.input_ports[0], value, version)
+
+    def set_port(self, port, value, version=None):
+        # Input is recognised by object identity and, when given, version of
+        # the block producing it, so same array is never compared elementwise.
+        if port not in self.input_ports:
+            raise ValueError("{0} has no input port {1}.".format(self, port))
+        tag = (version, fingerprint(value) if self._fingerprint_input else None)
+        if value is not self.get_port(port) or tag != self._port_tags.get(port):
+            self._store_port(port, value)
+            self._port_tags[port] = tag
             self._invalidate()
 
+    def get_port(self, port):
+        # pylint: disable=unused-argument
+        return self._input
+
+    def _store_port(self, port, value):
+        # pylint: disable=unused-argument
+        self._input = value
+
+    @property
+    def version(self):
+        # bumped whenever output is recomputed
+        return self._version
+
+    @property
+    def fingerprint_input(self):
+        # also compare content digest, for inputs modified in place
+        return self._fingerprint_input
+
+    @fingerprint_input.setter
+    def fingerprint_input(self, value):
+        if value != self._fingerprint_input:
+            self._fingerprint_input = value
+            self._port_tags = {}
+            self._invalidate()
+
+    @property
+    def is_valid(self):
+        return self._is_valid
+
     @property
     def output(self):
         if not self._is_valid:
             self._process()
+        elif self._profile is not None:
+            self._profile.hits += 1
         return self._output
 
+    @property
+    def seed(self):
+        # None, int or np.random.SeedSequence
+        return self._seed
+
+    @seed.setter
+    def seed(self, seed):
+        if get_seed_key(seed) != get_seed_key(self._seed):
+            self._seed = seed
+            self._reseed()
+            self._invalidate()
+
+    def _reseed(self):
+        pass
+
+    def _make_random(self, seed=None):
+        # independent of any other block and of global np.random state
+        return np.random.default_rng(self._seed if seed is None else seed)
+
+    @property
+    def parameters(self):
+        # current values of settable properties, e.g. for run metadata
+        values = {}
+        for cls in reversed(type(self).__mro__):
+            for name, attribute in vars(cls).items():
+                if isinstance(attribute, property) and attribute.fset and name not in self.NON_PARAMETERS:
+                    values[name] = getattr(self, name)
+        return values
+
+    @property
+    def recorded_signals(self):
+        # arrays (or tuples of them) a signal store keeps for re-analysis
+        return {'output': self.output}
+
+    @property
+    def profiling(self):
+        return self._profile is not None
+
+    @profiling.setter
+    def profiling(self, enabled):
+        # switching on starts fresh counters
+        self._profile = BlockProfile() if enabled else None
+
+    @property
+    def profile(self):
+        # BlockProfile, or None when profiling is off
+        return self._profile
+
     @property
     def sampling_frequency(self):
         return self._sampling_frequency
@@ -36,15 +192,105 @@ class AbstractBlock(object):
             self._sampling_frequency = value
             self._invalidate()
 
+    @property
+    def dtype(self):
+        # Precision of real output samples; complex ones get the matching
+        # complex type. Time, phase and filter state stay in float64.
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        dtype = np.dtype(dtype)
+        if dtype != self._dtype:
+            self._dtype = dtype
+            self._invalidate()
+
+    @property
+    def complex_dtype(self):
+        return np.result_type(self._dtype, np.complex64)
+
+    @property
+    def in_place(self):
+        # Output and work arrays are reused by the next computation of
+        # equal shape, so an output kept from before is overwritten.
+        return self._in_place
+
+    @in_place.setter
+    def in_place(self, in_place):
+        if in_place != self._in_place:
+            self._in_place = in_place
+            self._buffers = {}
+
+    def _get_buffer(self, name, shape, dtype):
+        # uninitialised array, the same one each time when in place
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            if self._in_place:
+                self._buffers[name] = buffer
+        return buffer
+
+    def _get_dtype(self, is_complex):
+        return self.complex_dtype if is_complex else self._dtype
+
+    def _cast(self, samples):
+        # real and complex samples to precision set by dtype, no copy if set
+        if not isinstance(samples, np.ndarray):
+            return samples
+        if np.issubdtype(samples.dtype, np.complexfloating):
+            return samples.astype(self.complex_dtype, copy=False)
+        if np.issubdtype(samples.dtype, np.floating):
+            return samples.astype(self._dtype, copy=False)
+        return samples
+
+    @property
+    def baseband(self):
+        # signals are complex envelopes around carrier instead of passband
+        return self._baseband
+
+    @baseband.setter
+    def baseband(self, value):
+        if value != self._baseband:
+            self._baseband = value
+            self._invalidate()
+
     def _process(self):
-        print("Processing in", self)
-        self._compute()
+        logger.debug("Processing in %s", self)
+        if self._profile is None:
+            self._compute()
+        else:
+            self._profile.measure(self._compute)
+            self._profile.count_samples(self._input, self._output)
+        self._output = self._cast(self._output)
+        self._version += 1
         self._validate()
 
     @abc.abstractmethod
     def _compute(self):
         raise NotImplementedError
 
+    def reset_stream(self):
+        self._reset_stream()
+
+    def process_frame(self, frame):
+        return self._cast(self._compute_frame(frame))
+
+    def flush_stream(self):
+        return self._cast(self._flush_stream())
+
+    def _reset_stream(self):
+        pass
+
+    def _compute_frame(self, frame):
+        raise NotImplementedError
+
+    def _flush_stream(self):
+        # pylint: disable=no-self-use
+        return np.zeros(0)
+
+    def invalidate(self):
+        self._invalidate()
+
     def _invalidate(self):
         self._is_valid = False
 
@@ -61,3 +307,6 @@ class AbstractBlock(object):
 class NullBlock(AbstractBlock):
     def _compute(self):
         self._output = self._input
+
+    def _compute_frame(self, frame):
+        return frame
@@ -0,0 +1,163 @@
+import numpy as np
+
+
+class ErrorStatistics(object):
+    # Running sums of error between a reference signal and its test copy,
+    # e.g. modulating and demodulated signals. Only sums, peak and counts
+    # on fixed histogram bins are kept, so memory does not depend on signal
+    # length and statistics of frames, Monte Carlo trials or worker
+    # processes merge exactly. Rows of batched signals are pooled.
+    FIELDS = ('samples', 'mse', 'sinad', 'output_snr', 'peak_error')
+    # sums go chunk by chunk, bounding temporaries
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, histogram_range=1.0, histogram_bins=100):
+        self.samples = 0
+        self.error_squares = 0.0
+        self.reference_squares = 0.0
+        self.test_squares = 0.0
+        self.peak_error = 0.0
+        # errors beyond range are counted in outer bins
+        self.histogram_edges = np.linspace(-histogram_range, histogram_range, histogram_bins + 1)
+        self.histogram = np.zeros(histogram_bins, dtype=np.int64)
+
+    @property
+    def mse(self):
+        return self.error_squares / self.samples if self.samples else None
+
+    @property
+    def sinad(self):
+        # [dB] power of test signal (signal, noise and distortion) to error
+        return self._to_db(self.test_squares)
+
+    @property
+    def output_snr(self):
+        # [dB] power of reference signal to error
+        return self._to_db(self.reference_squares)
+
+    def _to_db(self, squares):
+        if not self.samples:
+            return None
+        with np.errstate(divide='ignore'):
+            return float(10 * np.log10(squares / np.float64(self.error_squares)))
+
+    def update(self, reference, test):
+        reference, test = np.broadcast_arrays(reference, test)
+        edges = self.histogram_edges
+        for start in range(0, reference.shape[-1], self.CHUNK_SIZE):
+            reference_chunk = reference[..., start:start + self.CHUNK_SIZE]
+            test_chunk = test[..., start:start + self.CHUNK_SIZE]
+            error = test_chunk - reference_chunk
+            self.error_squares += float(np.sum(np.abs(error) ** 2))
+            self.reference_squares += float(np.sum(np.abs(reference_chunk) ** 2))
+            self.test_squares += float(np.sum(np.abs(test_chunk) ** 2))
+            self.peak_error = max(self.peak_error, float(np.max(np.abs(error))))
+            self.histogram += np.histogram(np.clip(np.real(error), edges[0], edges[-1]), edges)[0]
+        self.samples += reference.size
+        return self
+
+    def merge(self, other):
+        if not np.array_equal(self.histogram_edges, other.histogram_edges):
+            raise ValueError("Statistics with different histogram bins cannot be merged.")
+        self.samples += other.samples
+        self.error_squares += other.error_squares
+        self.reference_squares += other.reference_squares
+        self.test_squares += other.test_squares
+        self.peak_error = max(self.peak_error, other.peak_error)
+        self.histogram += other.histogram
+        return self
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class QualityMeter(object):
+    # Feeds ErrorStatistics with reference and test signals frame by frame,
+    # also as observer of System.stream:
+    #   meter = QualityMeter(system.get_block(system.GENERATOR),
+    #                        system.get_block(system.DEMODULATOR))
+    #   for _ in system.stream(4096, observer=meter): ...
+    #   meter.flush()
+    # Frames of both may differ in size, samples wait for their
+    # counterparts. Test lags reference by `delay` samples; with None it
+    # is estimated by cross-correlation of first alignment_size samples of
+    # both, within max_delay. First `skip` aligned samples are left out.
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, reference=None, test=None, delay=0, skip=0, statistics=None):
+        # pylint: disable=too-many-arguments
+        self.reference = reference
+        self.test = test
+        self.delay = delay
+        self.skip = skip
+        self.max_delay = 1024
+        self.alignment_size = 2 ** 14
+        self.statistics = ErrorStatistics() if statistics is None else statistics
+        self._pending = [None, None]  # reference, test
+        self._starts = [0, 0]  # sample numbers of first pending samples
+
+    def __call__(self, block, frame):
+        if block is self.reference:
+            self.update(reference=frame)
+        elif block is self.test:
+            self.update(test=frame)
+
+    def update(self, reference=None, test=None):
+        for index, samples in enumerate((reference, test)):
+            if samples is not None:
+                pending = self._pending[index]
+                self._pending[index] = samples if pending is None else np.concatenate((pending, samples), axis=-1)
+        if self.delay is None:
+            if min(self._get_pending_size(0), self._get_pending_size(1)) < self.alignment_size:
+                return self.statistics
+            self._align()
+        self._consume()
+        return self.statistics
+
+    def flush(self):
+        # aligns with what has come, if still needed; unmatched samples stay
+        if self.delay is None and self._get_pending_size(0) and self._get_pending_size(1):
+            self._align()
+            self._consume()
+        return self.statistics
+
+    def _align(self):
+        # pylint: disable=unsubscriptable-object
+        size = min(self._get_pending_size(0), self._get_pending_size(1), self.alignment_size)
+        lag = estimate_delay(self._pending[0][..., :size], self._pending[1][..., :size], self.max_delay)
+        self.delay = lag + self._starts[0] - self._starts[1]
+
+    def _consume(self):
+        # pylint: disable=unsubscriptable-object
+        # reference sample k pairs with test sample k + delay
+        reference, test = self._pending
+        if reference is None or test is None:
+            return
+        reference_start, test_start = self._starts
+        first = max(reference_start, test_start - self.delay, self.skip)
+        last = min(reference_start + reference.shape[-1], test_start + test.shape[-1] - self.delay)
+        if last > first:
+            self.statistics.update(reference[..., first - reference_start:last - reference_start],
+                                   test[..., first + self.delay - test_start:last + self.delay - test_start])
+        # samples before boundary are used or have no counterpart anymore
+        boundary = max(first, last)
+        drop = min(reference.shape[-1], max(0, boundary - reference_start))
+        self._pending[0], self._starts[0] = reference[..., drop:], reference_start + drop
+        drop = min(test.shape[-1], max(0, boundary + self.delay - test_start))
+        self._pending[1], self._starts[1] = test[..., drop:], test_start + drop
+
+    def _get_pending_size(self, index):
+        pending = self._pending[index]
+        return 0 if pending is None else pending.shape[-1]
+
+
+def estimate_delay(reference, test, max_delay):
+    # Lag of test behind reference (negative if ahead), at peak of their
+    # cross-correlation summed over rows, within +-max_delay samples.
+    size = reference.shape[-1] + test.shape[-1] - 1
+    spectrum = np.fft.fft(test, size) * np.conj(np.fft.fft(reference, size))
+    correlation = np.real(np.fft.ifft(spectrum))
+    correlation = correlation.reshape(-1, size).sum(axis=0)
+    lags = np.arange(size)
+    lags[lags >= test.shape[-1]] -= size  # negative lags wrap around
+    allowed = np.abs(lags) <= max_delay
+    return int(lags[allowed][np.argmax(correlation[allowed])])
@@ -1,11 +1,15 @@
 import abc
 
 import numpy as np
-import scipy.signal
 
-from blocks.meta import AbstractBlock
+from blocks import designs
+from blocks.lazy import LazyModule
+from blocks.meta import AbstractBlock, append_samples, get_peak
 import utils
 
+fft = LazyModule('scipy.fft')
+signal = LazyModule('scipy.signal')
+
 
 class FrequencyModem(AbstractBlock):
     __metaclass__ = abc.ABCMeta
@@ -41,17 +45,100 @@ class FrequencyModem(AbstractBlock):
 
 
 class FrequencyDemodulator(FrequencyModem):
+    # Hilbert transform is not causal, so in streaming mode every frame is
+    # transformed together with this many samples of past and future signal.
+    STREAM_CONTEXT = 8192
+
+    def __init__(self):
+        super(FrequencyDemodulator, self).__init__()
+        self._stream_history = None
+        self._stream_pending = None
+        self._stream_phase = None
+        self._stream_frequency = None
+
     def _compute(self):
-        frequencies = self._compute_instantaneous_frequencies()
-        without_carrier = frequencies - self._carrier_frequency
-        normalized = without_carrier / self._frequency_deviation
-        self._output = normalized
+        analytic = self._get_analytic_signal(self._input)
+        phase = self._get_buffer('phase', analytic.shape, np.float64)
+        np.arctan2(analytic.imag, analytic.real, out=phase, dtype=np.float64)
+        del analytic
+        self._output = self._compute_normalized_frequencies(
+            phase, self._get_buffer('output', phase.shape, self._dtype))
+
+    def _compute_normalized_frequencies(self, phase, out):
+        # Differences of consecutive phases wrapped to [-pi, pi) are what
+        # np.unwrap and np.diff give, without unwrapped phase in between.
+        # Done in place in output; last value repeats to keep samples count.
+        if out.shape[-1] < 2:
+            return out[..., :0]
+        diffs = out[..., :-1]
+        np.subtract(phase[..., 1:], phase[..., :-1], out=diffs)
+        diffs += np.pi
+        np.remainder(diffs, 2 * np.pi, out=diffs)
+        diffs -= np.pi
+        diffs *= self._sampling_frequency / (2 * np.pi * self._frequency_deviation)
+        if not self._baseband:
+            # complex envelope has its carrier removed already
+            diffs -= self._carrier_frequency / self._frequency_deviation
+        out[..., -1] = out[..., -2]
+        return out
+
+    def _normalize_frequencies(self, frequencies):
+        # complex envelope has its carrier removed already
+        without_carrier = frequencies if self._baseband else frequencies - self._carrier_frequency
+        return without_carrier / self._frequency_deviation
 
-    def _compute_instantaneous_frequencies(self):
-        hilbert = scipy.signal.hilbert(self._input)
-        phase = np.unwrap(np.angle(hilbert))
+    def _reset_stream(self):
+        self._stream_history = None
+        self._stream_pending = None
+        self._stream_phase = None
+        self._stream_frequency = None
+
+    def _compute_frame(self, frame):
+        self._stream_pending = append_samples(self._stream_pending, frame)
+        count = self._stream_pending.shape[-1] - self._get_stream_context()
+        if count <= 0:
+            return frame[..., :0]
+        return self._emit_stream_samples(count)
+
+    def _flush_stream(self):
+        if self._stream_pending is None or not self._stream_pending.size:
+            return np.zeros(0)
+        return self._emit_stream_samples(self._stream_pending.shape[-1])
+
+    def _emit_stream_samples(self, count):
+        window = append_samples(self._stream_history, self._stream_pending)
+        start = window.shape[-1] - self._stream_pending.shape[-1]
+        analytic = self._get_analytic_signal(window, padded=True)[..., start:window.shape[-1]]
+        # one extra sample (when already known) for the forward difference
+        phase = np.angle(analytic[..., :count + 1])
+        phase = np.unwrap(append_samples(self._stream_phase, phase))
+        if self._stream_phase is not None:
+            phase = phase[..., 1:]
+        self._stream_phase = phase[..., count - 1:count]
         diffs = np.diff(phase) / (2 * np.pi * self._get_time_step())
-        return np.append(diffs, diffs[-1])  # align for samples count
+        if diffs.shape[-1] < count:
+            last = diffs[..., -1:] if diffs.size else self._stream_frequency
+            diffs = np.concatenate((diffs, last), axis=-1)  # align for samples count
+        self._stream_frequency = diffs[..., -1:]
+        self._stream_history = window[..., :start + count][..., -self._get_stream_context():]
+        self._stream_pending = self._stream_pending[..., count:]
+        return self._normalize_frequencies(diffs)
+
+    def _get_analytic_signal(self, samples, padded=False):
+        # same as signal.hilbert, but spectrum is modified in place; single
+        # precision samples give complex64
+        if self._baseband:
+            return samples
+        count = samples.shape[-1]
+        fft_size = fft.next_fast_len(count) if padded else count
+        spectrum = fft.fft(samples, fft_size, axis=-1)
+        spectrum[..., 1:(fft_size + 1) // 2] *= 2
+        spectrum[..., fft_size // 2 + 1:] = 0
+        return fft.ifft(spectrum, axis=-1, overwrite_x=True)[..., :count]
+
+    def _get_stream_context(self):
+        # complex envelope needs just the next sample for phase difference
+        return 1 if self._baseband else self.STREAM_CONTEXT
 
     def __repr__(self):
         template = "Frequency Demodulator (carrier {0}Hz, deviation {1}Hz)"
@@ -59,38 +146,226 @@ class FrequencyDemodulator(FrequencyModem):
                                self._frequency_deviation)
 
 
+class DecimatingFrequencyDemodulator(FrequencyDemodulator):
+    # Mixes input down to complex baseband and decimates it with polyphase
+    # anti-alias filter, so phase is differentiated at a rate tied to
+    # signal bandwidth, not to the oversampled carrier.
+    BASEBAND_OVERSAMPLING = 4
+    OSCILLATOR_TABLE_SIZE = 1024
+
+    def __init__(self):
+        super(DecimatingFrequencyDemodulator, self).__init__()
+        self._bandwidth = None
+        self._interpolate = False
+        self._stream_offset = 0
+        self._stream_decimator = None
+        self._stream_interpolator = None
+        self._stream_delayed = False
+
+    @property
+    def bandwidth(self):
+        # half of the modulated signal band, e.g. modulating freq + deviation
+        return self._bandwidth
+
+    @bandwidth.setter
+    def bandwidth(self, bandwidth):
+        if bandwidth != self._bandwidth:
+            self._bandwidth = bandwidth
+            self._invalidate()
+
+    @property
+    def interpolate(self):
+        # resample output back to input timeline instead of the decimated one
+        return self._interpolate
+
+    @interpolate.setter
+    def interpolate(self, interpolate):
+        if interpolate != self._interpolate:
+            self._interpolate = interpolate
+            self._invalidate()
+
+    @property
+    def decimation(self):
+        if self._bandwidth is None:
+            raise ValueError("Bandwidth has to be set for decimating demodulator.")
+        rate = self.BASEBAND_OVERSAMPLING * self._bandwidth
+        return max(1, int(self._sampling_frequency // rate))
+
+    @property
+    def output_sampling_frequency(self):
+        if self._interpolate:
+            return self._sampling_frequency
+        return self._sampling_frequency / self.decimation
+
+    @property
+    def output_time_offset(self):
+        # [s] of first output sample. A decimated sample is the frequency
+        # between two phase samples, i.e. at the middle of their interval;
+        # interpolated output is delayed by that half interval instead.
+        if self._interpolate:
+            return 0
+        return self.decimation / 2 * self._get_time_step()
+
+    def _compute(self):
+        decimation = self.decimation
+        in_phase, quadrature = self._mix_down()
+        in_phase = signal.resample_poly(in_phase, 1, decimation, axis=-1)
+        quadrature = signal.resample_poly(quadrature, 1, decimation, axis=-1)
+        phase = np.unwrap(np.arctan2(quadrature, in_phase))
+        diffs = np.diff(phase) / (2 * np.pi * self._get_time_step() * decimation)
+        diffs = np.concatenate((diffs, diffs[..., -1:]), axis=-1)  # align for samples count
+        normalized = diffs / self._frequency_deviation
+        if self._interpolate:
+            samples_count = self._input.shape[-1]
+            normalized = self._delay_interpolated(signal.resample_poly(normalized, decimation, 1, axis=-1))
+            normalized = normalized[..., :samples_count]
+        self._output = normalized
+
+    def _delay_interpolated(self, samples):
+        # Interpolated sample n is the frequency at n + decimation / 2, see
+        # output_time_offset; the first one is repeated at the start.
+        head = np.repeat(samples[..., :1], self.decimation // 2, axis=-1)
+        return np.concatenate((head, samples), axis=-1)
+
+    def _mix_down(self):
+        # real in-phase and quadrature parts decimate faster than complex
+        if self._baseband:
+            return self._input.real, self._input.imag
+        oscillator = self._compute_local_oscillator(self._input.shape[-1])
+        return self._input * oscillator.real, self._input * oscillator.imag
+
+    def _compute_local_oscillator(self, samples_count, start=0):
+        # exp(-j omega n) for n from start on, as outer product of coarse and
+        # fine phasor tables, which is much cheaper than exp for every sample
+        table_size = self.OSCILLATOR_TABLE_SIZE
+        omega = utils.freq_to_omega(self._carrier_frequency) * self._get_time_step()
+        blocks_count = -(-samples_count // table_size)
+        coarse = np.exp(-1j * omega * (start + table_size * np.arange(blocks_count)))
+        fine = np.exp(-1j * omega * np.arange(table_size))
+        return np.outer(coarse, fine).ravel()[:samples_count]
+
+    def _reset_stream(self):
+        # Decimation and interpolation filters carry their input between
+        # frames, phase is unwrapped across them; the last decimated sample
+        # waits for the next one, which its phase difference needs.
+        super(DecimatingFrequencyDemodulator, self)._reset_stream()
+        self._stream_offset = 0
+        self._stream_decimator = designs.StreamResampler(1, self.decimation)
+        self._stream_interpolator = designs.StreamResampler(self.decimation, 1) if self._interpolate else None
+        self._stream_delayed = False
+
+    def _compute_frame(self, frame):
+        envelope = frame
+        if not self._baseband:
+            envelope = frame * self._compute_local_oscillator(frame.shape[-1], self._stream_offset)
+        self._stream_offset += frame.shape[-1]
+        return self._emit_frequencies(self._stream_decimator.process(envelope), final=False)
+
+    def _flush_stream(self):
+        return self._emit_frequencies(self._stream_decimator.flush(), final=True)
+
+    def _emit_frequencies(self, decimated, final):
+        phase = np.unwrap(append_samples(self._stream_phase, np.arctan2(decimated.imag, decimated.real)))
+        diffs = np.diff(phase) / (2 * np.pi * self._get_time_step() * self.decimation)
+        if phase.shape[-1]:
+            self._stream_phase = phase[..., -1:]
+        if diffs.shape[-1]:
+            self._stream_frequency = diffs[..., -1:]
+        if final and self._stream_frequency is not None:
+            diffs = np.concatenate((diffs, self._stream_frequency), axis=-1)  # align for samples count
+        normalized = diffs / self._frequency_deviation
+        if self._stream_interpolator is None:
+            return normalized
+        # interpolated output is cut to input length, as in batch
+        emitted = self._stream_interpolator.process(normalized)
+        if final:
+            emitted = np.concatenate((emitted, self._stream_interpolator.flush()), axis=-1)
+        if emitted.shape[-1] and not self._stream_delayed:
+            emitted = self._delay_interpolated(emitted)
+            self._stream_delayed = True
+        if final:
+            emitted = emitted[..., :max(0, emitted.shape[-1] - self._get_interpolated_excess())]
+        return emitted
+
+    def _get_interpolated_excess(self):
+        # samples past input length in the whole interpolated, delayed output
+        decimation = self.decimation
+        return -(-self._stream_offset // decimation) * decimation - self._stream_offset + decimation // 2
+
+    def __repr__(self):
+        template = "Decimating Frequency Demodulator (carrier {0}Hz, deviation {1}Hz)"
+        return template.format(self._carrier_frequency,
+                               self._frequency_deviation)
+
+
 class FrequencyModulator(FrequencyModem):
     def __init__(self):
         super(FrequencyModulator, self).__init__()
-        self._time = None
         self._carrier = None
+        self._stream_offset = 0
+        self._stream_phase = None
 
     @property
     def carrier(self):
+        # unmodulated carrier, computed on first request only
+        if self._carrier is None and not self._baseband and self._input is not None:
+            carrier = np.sin(self._get_carrier_phase(0, self._input.shape[-1]))
+            self._carrier = carrier.astype(self._get_dtype(False), copy=False)
         return self._carrier
 
+    def _invalidate(self):
+        super(FrequencyModulator, self)._invalidate()
+        self._carrier = None
+
     def _compute(self):
-        self._compute_time()
-        self._compute_carrier()
-        self._compute_output()
-
-    def _compute_time(self):
-        self._time = np.arange(0, len(self._input) / self._sampling_frequency,
-                               self._get_time_step())
-
-    def _compute_carrier(self):
-        omega = utils.freq_to_omega(self._carrier_frequency)
-        self._carrier = np.sin(omega * self._time)
-
-    def _compute_output(self):
-        omega = utils.freq_to_omega(self._carrier_frequency)
-        omega_dev = utils.freq_to_omega(self._frequency_deviation)
-        ph = np.cumsum(self._get_normalized_input()) / self._sampling_frequency
-        self._output = np.sin(omega * self._time + omega_dev * ph)
-        self._output = self._output / np.max(np.abs(self._output))
-
-    def _get_normalized_input(self):
-        return self._input / np.max(np.abs(self._input))
+        # Input normalization is folded into the phase scale, phase is
+        # accumulated in float64 whatever output precision is.
+        peak = get_peak(self._input)
+        phase = self._get_buffer('phase', self._input.shape, np.float64)
+        phase[...] = self._input
+        np.cumsum(phase, axis=-1, out=phase)
+        phase *= utils.freq_to_omega(self._frequency_deviation) / (self._sampling_frequency * peak)
+        output = self._get_buffer('output', phase.shape, self._get_dtype(self._baseband))
+        self._output = self._modulate(phase, 0, output)
+        if not self._baseband:
+            self._output /= get_peak(self._output)
+
+    def _modulate(self, phase, start, out):
+        # Phase of samples start.. is overwritten. Complex envelope of
+        # sin(omega t + phase) is -j exp(j phase), i.e. sin(phase) - j cos(phase).
+        if self._baseband:
+            np.sin(phase, out=out.real)
+            np.cos(phase, out=out.imag)
+            np.negative(out.imag, out=out.imag)
+            return out
+        phase += self._get_carrier_phase(start, start + phase.shape[-1])
+        return np.sin(phase, out=out)
+
+    def _get_carrier_phase(self, start, stop):
+        # omega t of samples start..stop - 1, in float64 since it grows
+        # large; computed on every call, not kept for a whole signal
+        carrier_phase = np.arange(start, stop, dtype=np.float64)
+        carrier_phase *= self._get_time_step()
+        carrier_phase *= utils.freq_to_omega(self._carrier_frequency)
+        return carrier_phase
+
+    def _reset_stream(self):
+        self._stream_offset = 0
+        self._stream_phase = None
+
+    def _compute_frame(self, frame):
+        # Peak of the whole input is unknown while streaming; frames are
+        # expected to be unit-peak already, as generators produce them.
+        start = self._stream_offset
+        if self._stream_phase is None:
+            self._stream_phase = np.zeros(frame.shape[:-1] + (1,))
+        # prepending carried sum keeps rounding identical to batch cumsum
+        sums = np.cumsum(append_samples(self._stream_phase, frame), axis=-1, dtype=np.float64)[..., 1:]
+        self._stream_offset = start + frame.shape[-1]
+        self._stream_phase = sums[..., -1:]
+        phase = sums * (utils.freq_to_omega(self._frequency_deviation) / self._sampling_frequency)
+        # frames are handed on, never reuse buffers for them
+        return self._modulate(phase, start, np.empty(phase.shape, self._get_dtype(self._baseband)))
 
     def __repr__(self):
         template = "Frequency Modulator (carrier {0}Hz, deviation {1}Hz)"
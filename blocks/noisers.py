@@ -1,22 +1,37 @@
 import numpy as np
-from scipy import signal
 
+from blocks import designs
 from blocks.meta import AbstractBlock
 
 
-class BandNoiser(AbstractBlock):
+class BandNoiser(designs.DesignedFilterMixin, AbstractBlock):
+    STOCHASTIC = True
+    FRAME_SIGNALS = ('noise',)
+    STATIC_SIGNALS = ('actual_snr',)
+    # powers are summed over chunks this long, bounding temporaries
+    POWER_CHUNK_SIZE = 2 ** 16
+
     def __init__(self):
         super(BandNoiser, self).__init__()
         self._expected_snr = 20
         self._noise = None
+        self._signal_power = None
+        self._noise_power = None
         self._freqs = None
+        self._stream_state = None
+        self._stream_stats = None
+        self._stream_noise_squares = None
+        self._stream_noise_gain = None
+        self._random = None
 
     @property
     def actual_snr(self):
-        mean = np.mean(self._input)
-        power_signal = np.sum((self._input - mean) ** 2)
-        power_noise = np.sum(self._noise ** 2)
-        return 10 * np.log10(power_signal / power_noise)
+        # one value per row for batched input; powers are the ones noise
+        # was computed and rescaled with, no signal is scanned again.
+        # While streaming, powers of frames so far.
+        if self._noise_power is None:
+            return None
+        return 10 * np.log10(self._signal_power / self._noise_power)
 
     @property
     def expected_snr(self):
@@ -39,36 +54,127 @@ class BandNoiser(AbstractBlock):
             self._invalidate()
 
     def _compute(self):
+        self._random = self._make_random()
+        self._signal_power = self._get_power(self._input)
         self._compute_base_noise()
         self._limit_noise_bandwidth()
         self._rescale_noise()
-        self._output = self._input + self._noise
+        out = self._get_buffer('output', self._input.shape,
+                               self._get_dtype(np.iscomplexobj(self._input) or np.iscomplexobj(self._noise)))
+        self._output = np.add(self._input, self._noise, out=out)
+
+    def _reset_stream(self):
+        self._stream_stats = (0, 0.0, 0.0)  # samples count, mean, squares sum
+        self._stream_noise_squares = 0.0
+        self._stream_state = None
+        # powers and noise describe the stream from now on (noise its last
+        # frame only), batch output is computed anew when requested again
+        self._signal_power = None
+        self._noise_power = None
+        self._noise = None
+        self._invalidate()
+        self._random = self._make_random()
+        if self.freqs:
+            design = self._get_filter_coefficients()
+            self._stream_noise_gain = self._compute_noise_gain(design)
+        else:
+            self._stream_noise_gain = 1
+
+    def _compute_frame(self, frame):
+        # Batch mode rescales noise to exact SNR of the whole realisation.
+        # Frames use a running input variance estimate and the analytical
+        # power gain of the band limiting filter instead.
+        variance = self._update_stream_variance(frame)
+        sigma = np.sqrt(variance / self._stream_noise_gain)
+        noise = sigma * (10 ** (-self._expected_snr / 20)) * self._draw_noise(frame.shape)
+        if self.freqs:
+            design = self._get_filter_coefficients()
+            if self._stream_state is None:
+                self._stream_state = designs.zero_state(design, frame.shape[:-1])
+            noise, self._stream_state = designs.apply(design, noise,
+                                                      self._stream_state)
+        self._noise = noise  # of this frame only
+        self._stream_noise_squares = self._stream_noise_squares + np.sum(np.abs(noise) ** 2, axis=-1)
+        self._signal_power = variance[..., 0]
+        self._noise_power = self._stream_noise_squares / self._stream_stats[0]
+        return frame + noise
+
+    def _update_stream_variance(self, frame):
+        count, mean, squares = self._stream_stats
+        size = frame.shape[-1]
+        frame_mean = np.mean(frame, axis=-1, keepdims=True)
+        frame_squares = np.sum(np.abs(frame - frame_mean) ** 2, axis=-1, keepdims=True)
+        total = count + size
+        delta = frame_mean - mean
+        mean = mean + delta * size / total
+        squares = squares + frame_squares + np.abs(delta) ** 2 * count * size / total
+        self._stream_stats = (total, mean, squares)
+        return squares / total
+
+    @staticmethod
+    def _compute_noise_gain(design):
+        # mean of |H|^2 over half of unit circle equals sum of squared
+        # impulse response samples, i.e. filter gain for white noise power
+        _, response = designs.frequency_response(design, 2 ** 16)
+        return np.mean(np.abs(response) ** 2)
 
     def _compute_base_noise(self):
-        var = self._get_input_variance()
-        sigma = np.sqrt(var) * (10 ** (-self._expected_snr / 20))
-        self._noise = sigma * np.random.randn(self._input.size)
+        sigma = np.sqrt(self._signal_power) * (10 ** (-self._expected_snr / 20))
+        self._noise = self._draw_noise(self._input.shape)
+        self._noise *= np.asarray(sigma)[..., np.newaxis]
+
+    def _draw_noise(self, shape):
+        # drawn in float64 and cast to output precision, since numpy draws
+        # float32 with another algorithm; realisations match at every precision
+        if not self._baseband:
+            return self._random.standard_normal(shape).astype(self._dtype, copy=False)
+        # circular complex noise of unit power
+        noise = self._random.standard_normal(shape + (2,)).astype(self._dtype, copy=False)
+        noise = noise.view(self.complex_dtype)[..., 0]
+        noise /= np.sqrt(2)
+        return noise
 
     def _limit_noise_bandwidth(self):
         if not self.freqs:
             return
+        designs.apply_in_place(self._get_filter_coefficients(), self._noise)
+
+    def _get_filter_coefficients(self):
         omegas = self._get_normalized_cutoff_omegas()
-        b, a = signal.butter(4, omegas, btype='bandpass')
-        self._noise = signal.lfilter(b, a, self._noise)
+        if self._baseband:
+            return self._design_butter(omegas, 'low')
+        return self._design_butter(omegas, 'bandpass')
 
     def _rescale_noise(self):
+        self._noise_power = self._get_power(self._noise, centered=False)
         snr_difference = self.actual_snr - self.expected_snr
-        self._noise *= 10 ** (snr_difference / 20)
+        gain = 10 ** (np.asarray(snr_difference) / 20)
+        self._noise *= gain[..., np.newaxis]
+        self._noise_power = self._noise_power * gain ** 2
 
-    def _get_input_variance(self):
-        length = self._input.size
-        average = np.mean(self._input)
-        return np.sum(np.abs(self._input - average) ** 2) / length
+    def _get_power(self, samples, centered=True):
+        # mean of squared deviation from mean (or from zero), per row
+        mean = np.mean(samples, axis=-1, keepdims=True) if centered else 0
+        squares = 0
+        for start in range(0, samples.shape[-1], self.POWER_CHUNK_SIZE):
+            deviation = samples[..., start:start + self.POWER_CHUNK_SIZE] - mean
+            squares = squares + np.sum(np.abs(deviation) ** 2, axis=-1)
+        return squares / samples.shape[-1]
 
     @property
     def noise(self):
         return self._noise
 
+    @property
+    def recorded_signals(self):
+        signals = super(BandNoiser, self).recorded_signals
+        signals['noise'] = self._noise
+        signals['actual_snr'] = self.actual_snr
+        return signals
+
     def _get_normalized_cutoff_omegas(self):
+        if self._baseband:
+            # band is centred at zero frequency of the complex envelope
+            return (self._freqs[1] - self._freqs[0]) / self._sampling_frequency
         return [2 * f / self._sampling_frequency
-                for f in self._freqs]
\ No newline at end of file
+                for f in self._freqs]
@@ -0,0 +1,64 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+
+class BlockProfile(object):
+    # Counters of one block, filled in by AbstractBlock while profiling is
+    # switched on. Allocations are measured only when tracemalloc traces,
+    # and are process wide, so concurrent blocks inflate each other's.
+    FIELDS = ('computes', 'hits', 'wall_time', 'cpu_time', 'input_samples',
+              'output_samples', 'output_bytes', 'allocated_bytes')
+
+    def __init__(self):
+        self.computes = 0
+        self.hits = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.input_samples = 0
+        self.output_samples = 0
+        self.output_bytes = 0
+        self.allocated_bytes = 0
+
+    def measure(self, compute):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        compute()
+        self.wall_time += time.perf_counter() - wall
+        self.cpu_time += time.thread_time() - cpu
+        if tracing:
+            self.allocated_bytes += max(0, tracemalloc.get_traced_memory()[1] - before)
+        self.computes += 1
+
+    def count_samples(self, samples_in, samples_out):
+        self.input_samples += self._get_size(samples_in)
+        self.output_samples += self._get_size(samples_out)
+        self.output_bytes += getattr(samples_out, 'nbytes', 0)
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @staticmethod
+    def _get_size(samples):
+        return int(np.size(samples)) if samples is not None else 0
+
+
+def format_table(profiles):
+    # profiles is {block name: BlockProfile.as_dict()}, times go in ms
+    header = ('block',) + BlockProfile.FIELDS
+    rows = [header]
+    for name, counters in profiles.items():
+        cells = [name]
+        for field in BlockProfile.FIELDS:
+            value = counters[field]
+            cells.append("{0:.3f}".format(value * 1e3) if field.endswith('_time') else str(value))
+        rows.append(cells)
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) if not column else cell.rjust(width)
+                       for column, (cell, width) in enumerate(zip(row, widths)))
+             for row in rows]
+    return "\n".join(lines)
@@ -1,10 +1,8 @@
 import os
+import sys
 
 import numpy as np
-import matplotlib
 
-import blocks
-import plots
 import utils
 import system
 
@@ -13,33 +11,32 @@ class InteractiveRunner(object):
     # pylint: disable=too-few-public-methods
     __INTERACTIVE__ = False
     plotOutputDir = "_output"
+    plotFormats = ('png', 'svg')
+    plotWorkers = None  # processes rendering figures, one per CPU by default
+    runStoreDir = None  # directory to keep signals in for later re-plotting
+    seed = None  # fixed seed makes runs repeatable, and so cacheable
+    cacheDir = None  # seeded runs are reused from here when set
+    cacheMaxBytes = 2 ** 30
+    dtype = 'float64'  # 'float32' halves memory, see System.dtype
+    inPlace = False  # blocks reuse their arrays between runs
+    makePlots = True  # headless runs never import matplotlib
 
     def __init__(self):
         self.data = utils.DataLoader()
         self._data = utils.DataLoader()
         self._system = None
 
-    @property
-    def half_band_width(self):
-        carrier_freq = self.data.carrier_freq
-        mod_freq = self.data.modulating_freq
-        freq_dev = self.data.freq_deviation
-        return mod_freq + freq_dev
-
     def run(self):
         self._set_up_packages()
         self._load_data()
         self._build_system()
-        self._system.simulate()
+        self._simulate()
+        self._store_run()
         self._report_info()
         self._make_plots()
 
     def _set_up_packages(self):
         np.set_printoptions(threshold=np.inf)
-        matplotlib.rc('font', family='DejaVu Sans', size='10')
-        matplotlib.rc('legend', fontsize=10)
-        matplotlib.rc('lines', markersize=3)
-        os.makedirs(self.plotOutputDir, exist_ok=True)
 
     def _load_data(self):
         if self.__INTERACTIVE__:
@@ -48,70 +45,47 @@ class InteractiveRunner(object):
             self._data.mock()
 
     def _build_system(self):
-        self._system = system.System()
-        self._build_system_blocks()
-        self._system.sampling_frequency = self._data.sampling_freq
-
-    def _build_system_blocks(self):
-        blocks_cascade = [self._make_generator(),
-                          self._make_modulator(),
-                          blocks.channels.MultiPathChannel(),
-                          self._make_noiser(),
-                          self._make_band_pass_filter(),
-                          self._make_demodulator()]
-        for block in blocks_cascade:
-            self._system.append_block(block)
-
-        # just for sake of readability later
-        self._system.GENERATOR = 0
-        self._system.MODULATOR = 1
-        self._system.MULTI_PATH_CHANNEL = 2
-        self._system.NOISE_CHANNEL = 3
-        self._system.LPF = 4
-        self._system.DEMODULATOR = 5
-
-    def _make_generator(self):
-        generator = blocks.generators.BandNoiseGenerator()
-        generator.generation_time = self._data.generation_time
-        generator.bandwidth = self._data.modulating_freq
-        return generator
-
-    def _make_modulator(self):
-        modulator = blocks.modems.FrequencyModulator()
-        modulator.frequency_deviation = self._data.freq_deviation
-        modulator.carrier_frequency = self._data.carrier_freq
-        return modulator
-
-    def _make_noiser(self):
-        noise_maker = blocks.noisers.BandNoiser()
-        noise_maker.expected_snr = self._data.expected_snr
-        carrier_freq = self.data.carrier_freq
-        half_band_width = self.half_band_width
-        noise_maker.freqs = [f + carrier_freq for f in (-half_band_width,
-                                                        half_band_width)]
-        return noise_maker
-
-    def _make_band_pass_filter(self):
-        filter_block = blocks.filters.BandPassFilter()
-        carrier_freq = self.data.carrier_freq
-        half_band_width = self.half_band_width
-        filter_block.freqs = [f + carrier_freq for f in (-half_band_width,
-                                                         half_band_width)]
-        return filter_block
+        self._system = system.SystemBuilder(self._data, dtype=self.dtype).build()
+        self._system.seed = self.seed
+        self._system.in_place = self.inPlace
+
+    def _simulate(self):
+        # a cache hit replaces system with its stored, memory mapped run
+        cache = None
+        if self.cacheDir and self.seed is not None:
+            cache = system.ResultCache(self.cacheDir, self.cacheMaxBytes)
+            cached = cache.load(self._system, self.seed)
+            if cached is not None:
+                self._system = cached
+                return
+        self._system.simulate()
+        if cache is not None:
+            cache.save(self._system, self.seed)
 
-    def _make_demodulator(self):
-        demodulator = blocks.modems.FrequencyDemodulator()
-        demodulator.frequency_deviation = self._data.freq_deviation
-        demodulator.carrier_frequency = self._data.carrier_freq
-        return demodulator
+    def _store_run(self):
+        if self.runStoreDir and isinstance(self._system, system.System):
+            system.SignalStore(self.runStoreDir).save_system(self._system)
 
     def _report_info(self):
         actual_snr = self._system.get_block(self._system.NOISE_CHANNEL).actual_snr
         print("Actual SNR: ", actual_snr)
 
     def _make_plots(self):
-        plots.SystemPlotMaker(self._system, self.plotOutputDir).make()
+        if not self.makePlots:
+            return
+        # pylint: disable=import-outside-toplevel
+        # figures are only saved, no GUI backend is needed
+        import matplotlib
+        matplotlib.use('Agg')
+        matplotlib.rc('font', family='DejaVu Sans', size='10')
+        matplotlib.rc('legend', fontsize=10)
+        matplotlib.rc('lines', markersize=3)
+        import plots
+        os.makedirs(self.plotOutputDir, exist_ok=True)
+        plots.SystemPlotMaker(self._system, self.plotOutputDir, self.plotFormats, self.plotWorkers).make()
 
 
 if __name__ == "__main__":
-    InteractiveRunner().run()
+    runner = InteractiveRunner()
+    runner.makePlots = '--headless' not in sys.argv[1:]
+    runner.run()
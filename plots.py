@@ -1,23 +1,54 @@
+import concurrent.futures
 import os
+import sys
 
+import matplotlib
 from matplotlib import ticker
 from matplotlib import pyplot as plt
 import numpy as np
-import scipy
 
-import utils
+from blocks import analyzers
+from blocks import designs
+import system as simulation
 
 
 class SystemPlotMaker(object):
     # pylint: disable=too-few-public-methods
-    def __init__(self, system, output_dir):
-        self.data = utils.DataLoader()
+    # Frequencies come from block parameters, so the same plots are made
+    # for a simulated System and for a StoredSystem opened from disk.
+    # Data of every figure is prepared here, each spectrum once per signal,
+    # and figures are rendered by module level functions in a process pool.
+    # Long signals are reduced to what can be seen before they are drawn:
+    # time traces to min/max envelope per pixel column, spectra to Welch
+    # averages with about one frequency bin per pixel, so plot size and time
+    # do not grow with simulation length.
+    INPUTS_FIGSIZE = (8, 12)
+
+    def __init__(self, system, output_dir, formats=('png', 'svg'), workers=None):
         self._system = system
         self._output_dir = output_dir
+        self._formats = tuple(formats)
+        self._workers = workers
         self._plot_counter = 0
+        self._spectra = {}
+        self._jobs = []
         for f in os.listdir(self._output_dir):
             os.remove(os.path.join(self._output_dir, f))
 
+    @classmethod
+    def from_store(cls, path, output_dir, **kwargs):
+        # plots a finished run without simulating anything again
+        return cls(simulation.SignalStore(path).open_system(), output_dir, **kwargs)
+
+    @property
+    def _carrier_freq(self):
+        return self._system.get_block(self._system.MODULATOR).parameters['carrier_frequency']
+
+    @property
+    def _modulating_freq(self):
+        parameters = self._system.get_block(self._system.GENERATOR).parameters
+        return parameters.get('bandwidth', parameters.get('frequency'))
+
     def make(self):
         self._make_inputs_plot()
         self._make_noise_spectrum_plots()
@@ -25,168 +56,284 @@ class SystemPlotMaker(object):
         self._make_demod_plots()
         self._make_filter_plots()
         self._make_error_plots()
+        self._render()
 
     def _make_inputs_plot(self):
-        GRID_X, GRID_Y = 1, 3
-        time = self._system.timeline
         generator = self._system.get_block(self._system.GENERATOR)
         modulator = self._system.get_block(self._system.MODULATOR)
-        plt.figure(figsize=(8, 12))
-        plt.subplot(GRID_Y, GRID_X, 1)
-        plt.plot(time, generator.output)
-        plt.title(self._build_title("Sygnał modulujący"))
-        self._add_std_figure_formatting('s', 'V')
-        plt.subplot(GRID_Y, GRID_X, 2)
-        self._plot_single_spectrum(generator.output)
-        plt.title(self._build_title("Widmo sygnału modulującego"))
-        plt.xlim(0, utils.DataLoader().modulating_freq * 3)
-        plt.subplot(GRID_Y, GRID_X, 3)
-        plt.title(self._build_title("Widmo amplitudowe sygnału zmodulowanego"))
-        self._plot_single_spectrum(modulator.output)
-        plt.tight_layout()
-        self._save_plt("input")
+        titles = [self._build_title("Sygnał modulujący"),
+                  self._build_title("Widmo sygnału modulującego"),
+                  self._build_title("Widmo amplitudowe sygnału zmodulowanego")]
+        width = self._get_pixel_width(self.INPUTS_FIGSIZE)
+        self._add_job(render_inputs, "input", titles=titles, figsize=self.INPUTS_FIGSIZE,
+                      message=reduce_to_envelope(self._system.timeline, generator.output, width),
+                      message_spectrum=self._get_spectrum(generator.output, 3 * self._modulating_freq, width),
+                      modulated_spectrum=self._get_spectrum(modulator.output, width=width),
+                      modulating_freq=self._modulating_freq, carrier_freq=self._carrier_freq)
 
     def _make_noise_time_plots(self):
-        time = self._system.timeline
         channel = self._system.get_block(self._system.MULTI_PATH_CHANNEL)
         lpf = self._system.get_block(self._system.LPF)
-        plt.figure()
-        plt.plot(time, channel.input, '-g',
-                 time, channel.output, ':b',
-                 time, lpf.output, '-.r')
-        plt.legend(["Sygnał nadany", "Sygnał odebrany", "Sygnał odebrany po filtracji"])
-        self._add_std_figure_formatting('s', 'V')
-        plt.title(self._build_title("Przebiegi czasowe w paśmie wysokiej częstotliwości"))
-        self._save_plt("pre_post_noise")
-
-        plt.figure()
-        self._plot_single_spectrum(channel.output)
-        plt.title(self._build_title("Widmo sygnału odebranego"))
-        self._save_plt("noised_spectrum")
+        title = self._build_title("Przebiegi czasowe w paśmie wysokiej częstotliwości")
+        self._add_job(render_time_comparison, "pre_post_noise", title=title,
+                      traces=self._get_traces(channel.input, channel.output, lpf.output),
+                      styles=['-g', ':b', '-.r'],
+                      legend=["Sygnał nadany", "Sygnał odebrany", "Sygnał odebrany po filtracji"])
+        title = self._build_title("Widmo sygnału odebranego")
+        self._add_job(render_spectra, "noised_spectrum", title=title,
+                      spectra=[self._get_spectrum(channel.output)], carrier_freq=self._carrier_freq)
 
     def _make_noise_spectrum_plots(self):
         channel = self._system.get_block(self._system.NOISE_CHANNEL)
         filt = self._system.get_block(self._system.LPF)
-        fc, c = self._compute_spectrum_for_plot(channel.output)
-        ff, f = self._compute_spectrum_for_plot(filt.output)
-        plt.figure()
-        plt.plot(fc, c, 'g', ff, f, ':b')
-        plt.legend(["Sygnał w kanale", "Sygnał odfiltrowany"])
-        plt.title(self._build_title("Widma sygnałów w kanale oraz po filtracji"))
-        self._format_spectrum()
-        fc = self.data.carrier_freq
-        plt.xlim((fc / 2, 3 * fc / 2))
-        self._save_plt("filtered_spectrum")
-
-        plt.figure()
-        plt.title(self._build_title("Widmo addytywnego szumu w kanale"))
-        noise_channel = self._system.get_block(self._system.NOISE_CHANNEL)
-        self._plot_single_spectrum(noise_channel.noise)
-        self._save_plt("added_noise")
+        fc = self._carrier_freq
+        title = self._build_title("Widma sygnałów w kanale oraz po filtracji")
+        self._add_job(render_spectra, "filtered_spectrum", title=title,
+                      spectra=[self._get_spectrum(channel.output, fc), self._get_spectrum(filt.output, fc)],
+                      styles=['g', ':b'], legend=["Sygnał w kanale", "Sygnał odfiltrowany"],
+                      carrier_freq=fc, xlim=(fc / 2, 3 * fc / 2))
+
+        title = self._build_title("Widmo addytywnego szumu w kanale")
+        self._add_job(render_spectra, "added_noise", title=title,
+                      spectra=[self._get_spectrum(channel.noise)], carrier_freq=fc)
 
     def _make_demod_plots(self):
-        time = self._system.timeline
         demod = self._system.get_block(self._system.DEMODULATOR)
         mod = self._system.get_block(self._system.MODULATOR)
-        plt.figure()
-        plt.plot(time, mod.input, '-g',
-                 time, demod.output, ':b')
-        plt.legend(["Sygnał modulujący", "Sygnał zdemodulowany"])
-        self._add_std_figure_formatting('s', 'V')
-        plt.title(self._build_title("Sygnał modulujący i zdemodulowany"))
-        plt.ylim((-1, 1))
-        self._save_plt("modulated_demodulated")
+        title = self._build_title("Sygnał modulujący i zdemodulowany")
+        self._add_job(render_time_comparison, "modulated_demodulated", title=title,
+                      traces=self._get_traces(mod.input, demod.output),
+                      styles=['-g', ':b'], legend=["Sygnał modulujący", "Sygnał zdemodulowany"],
+                      ylim=(-1, 1))
 
     def _make_channel_plots(self):
-        plt.figure()
         channel = self._system.get_block(self._system.MULTI_PATH_CHANNEL)
-        plt.stem(channel._impulse_response, basefmt='')
-        plt.title(self._build_title("Odpowiedź impulsowa kanału"))
-        plt.grid('on')
-        length = len(channel._impulse_response)
-        plt.xlim((-length / 20, length))
-        self._save_plt("channel_impulse")
+        title = self._build_title("Odpowiedź impulsowa kanału")
+        self._add_job(render_impulse_response, "channel_impulse", title=title,
+                      response=channel.impulse_response)
 
     def _make_filter_plots(self):
         filt = self._system.get_block(self._system.LPF)
-        b, a = filt.coefficients
-        fs = self.data.sampling_freq
+        fs = self._system.sampling_frequency
         length = 1000
-        impulse = np.repeat(0, length)
-        impulse[0] = 1
-        response = scipy.signal.lfilter(b, a, impulse)
-
-        w, h = scipy.signal.freqz(*filt.coefficients)
-        f = w / np.max(w) * fs / 2
-        plt.figure()
-        plt.subplot(2, 1, 1)
-        plt.plot(response, '.-')
-        plt.title(self._build_title("Odpowiedź impulsowa użytego filtru Butterwortha"))
-        plt.grid('on')
-        plt.xlabel("Nr próbki")
-        plt.ylabel("Wartość próbki")
-        plt.xlim((0, length))
-
-        plt.subplot(2, 1, 2)
-        plt.plot(f, 20 * np.log10(np.abs(h)), '.-')
-        plt.title(self._build_title("Odpowiedź częstotliwościowa użytego filtru Butterwortha"))
-        self._add_std_figure_formatting("Hz", "dB")
-        plt.ylim((-30, 1))
-        plt.xlim(0, self.data.carrier_freq * 2)
-        plt.tight_layout()
-        self._save_plt("filter")
+        w, h = designs.frequency_response(filt.design)
+        titles = [self._build_title("Odpowiedź impulsowa użytego filtru Butterwortha"),
+                  self._build_title("Odpowiedź częstotliwościowa użytego filtru Butterwortha")]
+        self._add_job(render_filter, "filter", titles=titles,
+                      response=designs.impulse_response(filt.design, length),
+                      frequencies=w / np.max(w) * fs / 2, gains=20 * np.log10(np.abs(h)),
+                      carrier_freq=self._carrier_freq)
 
     def _make_error_plots(self):
-        plt.figure()
-        time = self._system.timeline
         demod = self._system.get_block(self._system.DEMODULATOR)
         mod = self._system.get_block(self._system.MODULATOR)
-        error = demod.output - mod.input
-        plt.semilogy(time, error)
-        self._add_std_figure_formatting('s', 'V')
-        plt.title(self._build_title("Wykres błędu demodulacji"))
-        self._save_plt("error")
-
-    def _plot_single_spectrum(self, signal, style=None):
-        f, amp = self._compute_spectrum_for_plot(signal)
-        args = [style] if style else []
-        plt.plot(f, amp, *args)
-        self._format_spectrum()
-
-    def _format_spectrum(self):
-        yLimit = -70
-        plt.xlim(0, utils.DataLoader().carrier_freq * 2)
-        plt.ylim((yLimit, 0))
-        self._add_std_figure_formatting('Hz', 'dB')
-
-
-    def _compute_spectrum_for_plot(self, signal):
-        sampling_freq = self._system.sampling_frequency
-        samples_count = len(signal)
-        yf = np.fft.fft(signal)
-        xf = np.fft.fftfreq(samples_count, 1 / sampling_freq)
-        xf = np.fft.fftshift(xf)
-        yplot = 1.0 / samples_count * np.fft.fftshift(yf)
-        return xf, 20 * np.log10(np.abs(yplot))
-
-    def _add_std_figure_formatting(self, x_unit, y_unit):
-        # pylint: disable=no-self-use
-        x_formatter = ticker.EngFormatter(unit=x_unit)
-        y_formatter = ticker.EngFormatter(unit=y_unit)
-        x_formatter.ENG_PREFIXES[-6] = 'u'
-        y_formatter.ENG_PREFIXES[-6] = 'u'
-        ax = plt.gca()
-        ax.xaxis.set_major_formatter(x_formatter)
-        ax.yaxis.set_major_formatter(y_formatter)
-        plt.grid('on', which='both')
-
-    def _save_plt(self, filename):
-        for ext in ['png', 'svg']:
-            full_filename = os.path.extsep.join((filename, ext))
-            full_filename = "%02d%s" % (self._plot_counter, full_filename)
-            plt.savefig(os.path.join(self._output_dir, full_filename))
+        title = self._build_title("Wykres błędu demodulacji")
+        self._add_job(render_error, "error", title=title,
+                      error=self._get_traces(demod.output - mod.input)[0])
+
+    def _get_traces(self, *signals):
+        width = self._get_pixel_width()
+        return [reduce_to_envelope(self._system.timeline, signal, width) for signal in signals]
+
+    def _get_spectrum(self, signal, span=None, width=None):
+        # Span is the visible frequency range, 2 * carrier by default; it
+        # sets segment length. Keyed by identity and segment length; signal
+        # is kept, so its id cannot be reused.
+        fs = self._system.sampling_frequency
+        span = span or 2 * self._carrier_freq
+        width = width or self._get_pixel_width()
+        segment = min(len(signal), 2 ** int(np.ceil(np.log2(width * fs / span))))
+        key = (id(signal), segment)
+        if key not in self._spectra:
+            self._spectra[key] = (signal, self._compute_spectrum_for_plot(signal, segment))
+        return self._spectra[key][1]
+
+    def _compute_spectrum_for_plot(self, signal, segment):
+        # Welch average of power spectrum; a tone has the same level as in
+        # amplitude spectrum of one full length FFT
+        analyzer = analyzers.SpectrumAnalyzer(segment, scaling='spectrum')
+        analyzer.sampling_frequency = self._system.sampling_frequency
+        analyzer.input = signal
+        with np.errstate(divide='ignore'):
+            return analyzer.frequencies, 10 * np.log10(analyzer.output)
+
+    @staticmethod
+    def _get_pixel_width(figsize=None):
+        figsize = figsize or matplotlib.rcParams['figure.figsize']
+        dpi = matplotlib.rcParams['savefig.dpi']
+        if dpi == 'figure':
+            dpi = matplotlib.rcParams['figure.dpi']
+        return int(np.ceil(figsize[0] * dpi))
+
+    def _add_job(self, render, filename, **data):
+        # file is numbered after the last title of its figure
+        filename = "%02d%s" % (self._plot_counter, filename)
+        path = os.path.join(self._output_dir, filename)
+        self._jobs.append((render, path, data))
+
+    def _render(self):
+        jobs, self._jobs = self._jobs, []
+        if self._workers == 1:
+            for render, path, data in jobs:
+                _render_job(render, path, self._formats, data)
+            return
+        with concurrent.futures.ProcessPoolExecutor(self._workers, initializer=_init_worker,
+                                                    initargs=(_get_changed_rc_params(),)) as pool:
+            rendered = [pool.submit(_render_job, render, path, self._formats, data)
+                        for render, path, data in jobs]
+            for future in rendered:
+                future.result()
 
     def _build_title(self, title):
         self._plot_counter += 1
         prefix = "Wykres {0}.".format(self._plot_counter)
         return " ".join((prefix, title))
+
+
+def reduce_to_envelope(time, samples, width):
+    # Minimum and maximum of every one of `width` bins, drawn as vertical
+    # strokes, look like all samples in a plot `width` pixels wide.
+    samples = np.asarray(samples)
+    count = samples.shape[-1]
+    if count <= 2 * width:
+        return time, samples
+    starts = np.linspace(0, count, width, endpoint=False).astype(int)
+    envelope = np.empty(samples.shape[:-1] + (2 * width,), dtype=samples.dtype)
+    envelope[..., 0::2] = np.minimum.reduceat(samples, starts, axis=-1)
+    envelope[..., 1::2] = np.maximum.reduceat(samples, starts, axis=-1)
+    return np.repeat(time[starts], 2), envelope
+
+
+def render_inputs(titles, figsize, message, message_spectrum, modulated_spectrum, modulating_freq, carrier_freq):
+    # pylint: disable=too-many-arguments
+    grid_x, grid_y = 1, 3
+    figure = plt.figure(figsize=figsize)
+    plt.subplot(grid_y, grid_x, 1)
+    plt.plot(*message)
+    plt.title(titles[0])
+    _add_std_figure_formatting('s', 'V')
+    plt.subplot(grid_y, grid_x, 2)
+    plt.plot(*message_spectrum)
+    _format_spectrum(carrier_freq)
+    plt.title(titles[1])
+    plt.xlim(0, modulating_freq * 3)
+    plt.subplot(grid_y, grid_x, 3)
+    plt.title(titles[2])
+    plt.plot(*modulated_spectrum)
+    _format_spectrum(carrier_freq)
+    plt.tight_layout()
+    return figure
+
+
+def render_time_comparison(title, traces, styles, legend, ylim=None):
+    # pylint: disable=too-many-arguments
+    figure = plt.figure()
+    arguments = []
+    for (time, signal), style in zip(traces, styles):
+        arguments += [time, signal, style]
+    plt.plot(*arguments)
+    plt.legend(legend)
+    _add_std_figure_formatting('s', 'V')
+    plt.title(title)
+    if ylim is not None:
+        plt.ylim(ylim)
+    return figure
+
+
+def render_spectra(title, spectra, carrier_freq, styles=None, legend=None, xlim=None):
+    # pylint: disable=too-many-arguments
+    figure = plt.figure()
+    arguments = []
+    for index, (frequencies, amplitudes) in enumerate(spectra):
+        arguments += [frequencies, amplitudes] + ([styles[index]] if styles else [])
+    plt.plot(*arguments)
+    if legend is not None:
+        plt.legend(legend)
+    plt.title(title)
+    _format_spectrum(carrier_freq)
+    if xlim is not None:
+        plt.xlim(xlim)
+    return figure
+
+
+def render_impulse_response(title, response):
+    figure = plt.figure()
+    plt.stem(response, basefmt='')
+    plt.title(title)
+    plt.grid('on')
+    length = len(response)
+    plt.xlim((-length / 20, length))
+    return figure
+
+
+def render_filter(titles, response, frequencies, gains, carrier_freq):
+    # pylint: disable=too-many-arguments
+    figure = plt.figure()
+    plt.subplot(2, 1, 1)
+    plt.plot(response, '.-')
+    plt.title(titles[0])
+    plt.grid('on')
+    plt.xlabel("Nr próbki")
+    plt.ylabel("Wartość próbki")
+    plt.xlim((0, len(response)))
+
+    plt.subplot(2, 1, 2)
+    plt.plot(frequencies, gains, '.-')
+    plt.title(titles[1])
+    _add_std_figure_formatting("Hz", "dB")
+    plt.ylim((-30, 1))
+    plt.xlim(0, carrier_freq * 2)
+    plt.tight_layout()
+    return figure
+
+
+def render_error(title, error):
+    figure = plt.figure()
+    plt.semilogy(*error)
+    _add_std_figure_formatting('s', 'V')
+    plt.title(title)
+    return figure
+
+
+def _format_spectrum(carrier_freq):
+    y_limit = -70
+    plt.xlim(0, carrier_freq * 2)
+    plt.ylim((y_limit, 0))
+    _add_std_figure_formatting('Hz', 'dB')
+
+
+def _add_std_figure_formatting(x_unit, y_unit):
+    x_formatter = ticker.EngFormatter(unit=x_unit)
+    y_formatter = ticker.EngFormatter(unit=y_unit)
+    x_formatter.ENG_PREFIXES[-6] = 'u'
+    y_formatter.ENG_PREFIXES[-6] = 'u'
+    ax = plt.gca()
+    ax.xaxis.set_major_formatter(x_formatter)
+    ax.yaxis.set_major_formatter(y_formatter)
+    plt.grid('on', which='both')
+
+
+def _render_job(render, path, formats, data):
+    # figure is closed once saved, so rendering many keeps memory flat
+    figure = render(**data)
+    try:
+        for ext in formats:
+            figure.savefig(os.path.extsep.join((path, ext)))
+    finally:
+        plt.close(figure)
+
+
+def _get_changed_rc_params():
+    # style set up by the caller, e.g. fonts set in main, for workers
+    return {key: value for key, value in matplotlib.rcParams.items()
+            if key != 'backend' and value != matplotlib.rcParamsDefault.get(key)}
+
+
+def _init_worker(rc_params):
+    plt.switch_backend('Agg')
+    matplotlib.rcParams.update(rc_params)
+
+
+if __name__ == "__main__":
+    # python3 plots.py RUN_DIR OUTPUT_DIR re-plots a stored run
+    SystemPlotMaker.from_store(sys.argv[1], sys.argv[2]).make()
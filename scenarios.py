@@ -0,0 +1,141 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import sys
+import time
+import traceback
+
+import numpy as np
+
+import system
+import utils
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11 reads JSON only
+    tomllib = None
+
+
+# Options of a run, besides SimulationParameters fields
+OPTIONS = ('name', 'seed', 'baseband', 'dtype', 'doppler', 'guard')
+
+
+def load_scenarios(path):
+    # JSON or TOML file with a list of scenarios, each a table of
+    # SimulationParameters fields and OPTIONS; `defaults` apply to all.
+    #   {"defaults": {"generation_time": 1e-5},
+    #    "scenarios": [{"name": "low", "expected_snr": 10}, ...]}
+    # Fields left out follow from given ones as in the mock scenario.
+    if os.path.splitext(path)[1].lower() == '.toml':
+        if tomllib is None:
+            raise ValueError("Reading TOML needs Python 3.11 or newer.")
+        with open(path, 'rb') as scenarios_file:
+            content = tomllib.load(scenarios_file)
+    else:
+        with open(path) as scenarios_file:
+            content = json.load(scenarios_file)
+    defaults = content.get('defaults', {})
+    scenarios = []
+    for index, values in enumerate(content['scenarios']):
+        scenario = dict(defaults)
+        scenario.update(values)
+        scenario.setdefault('name', "scenario{0:04d}".format(index))
+        scenarios.append(scenario)
+    names = [scenario['name'] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names have to be unique.")
+    return scenarios
+
+
+class ScenarioRunner(object):
+    # pylint: disable=too-few-public-methods
+    # Every scenario builds its own System from its own parameters, in a
+    # pool of worker processes; nothing is shared between scenarios, so
+    # results do not depend on the number of workers or on task order.
+    def __init__(self, scenarios, workers=None, seed=0, store_dir=None):
+        self._scenarios = list(scenarios)
+        self.workers = workers
+        self.seed = seed
+        self.store_dir = store_dir
+
+    def run(self):
+        # records in order of scenarios; a failed one has 'error' set
+        tasks = [self._make_task(index, scenario) for index, scenario in enumerate(self._scenarios)]
+        workers = self.workers or os.cpu_count() or 1
+        if workers == 1:
+            return [run_scenario(*task) for task in tasks]
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            return list(pool.map(run_scenario, *zip(*tasks)))
+
+    def _make_task(self, index, scenario):
+        # scenarios without own seed get one of the root seed and position
+        scenario = dict(scenario)
+        if scenario.get('seed') is None:
+            sequence = np.random.SeedSequence(self.seed, spawn_key=(index,))
+            scenario['seed'] = int(sequence.generate_state(1)[0])
+        store = None if self.store_dir is None else os.path.join(self.store_dir, scenario['name'])
+        return scenario, store
+
+
+def run_scenario(scenario, store=None):
+    record = {'name': scenario['name'], 'scenario': scenario, 'store': store}
+    start = time.perf_counter()
+    try:
+        parameters = utils.SimulationParameters.mock(
+            **{field: value for field, value in scenario.items() if field not in OPTIONS})
+        utils.validate(parameters)
+        builder = system.SystemBuilder(parameters, baseband=scenario.get('baseband', False),
+                                       dtype=scenario.get('dtype', 'float64'),
+                                       doppler=scenario.get('doppler'))
+        simulated = builder.build()
+        simulated.seed = scenario['seed']
+        simulated.simulate()
+        record['parameters'] = parameters.as_dict()
+        quality = system.measure_quality(simulated, scenario.get('guard', 0.1))
+        record['results'] = {
+            'actual_snr': simulated.get_block(simulated.NOISE_CHANNEL).actual_snr,
+            'demodulation_mse': quality.mse,
+            'demodulation_sinad': quality.sinad,
+            'demodulation_snr': quality.output_snr,
+            'demodulation_peak_error': quality.peak_error}
+        if store is not None:
+            system.SignalStore(store).save_system(simulated, scenario['seed'])
+    except Exception:  # pylint: disable=broad-except
+        # one bad scenario must not take down the whole batch
+        record['error'] = traceback.format_exc()
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def make_manifest(records):
+    return {'environment': {'python': platform.python_version(),
+                            'numpy': np.__version__,
+                            'platform': platform.platform(),
+                            'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'failed': sum('error' in record for record in records),
+            'scenarios': records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many scenarios without interaction or plots.")
+    parser.add_argument('scenarios', help="JSON or TOML file of scenarios")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=0, help="root seed of scenarios without own seed")
+    parser.add_argument('--store', help="directory to keep signals of every scenario in, for plots")
+    parser.add_argument('--output', help="JSON manifest of results (default: stdout)")
+    args = parser.parse_args()
+
+    runner = ScenarioRunner(load_scenarios(args.scenarios), args.workers, args.seed, args.store)
+    manifest = make_manifest(runner.run())
+    system.store.write_json(manifest, args.output)
+    for record in manifest['scenarios']:
+        if 'error' in record:
+            print("Scenario {0} failed:\n{1}".format(record['name'], record['error']), file=sys.stderr)
+    if manifest['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
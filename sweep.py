@@ -0,0 +1,161 @@
+import argparse
+import concurrent.futures
+import itertools
+import math
+import operator
+import os
+
+import numpy as np
+
+import system
+import utils
+from blocks import metrics
+from blocks.lazy import LazyModule
+
+
+CHANNEL_SEED_KEY = 0
+TRIAL_SEED_KEY = 1
+
+stats = LazyModule('scipy.stats')  # needed by the parent process only
+
+# Systems built by this worker process, reused across its tasks, so block
+# construction and filter design are not repeated for every trial.
+_worker_systems = {}
+
+
+class SweepResult(object):
+    # pylint: disable=too-few-public-methods
+    def __init__(self, snrs, deviations, paths, errors, confidence, quality=None):
+        # pylint: disable=too-many-arguments
+        self.snrs = np.asarray(snrs)
+        self.deviations = np.asarray(deviations)
+        self.paths = np.asarray(paths)
+        self.errors = errors  # shape: snrs x deviations x paths x trials
+        self.quality = quality  # ErrorStatistics of all trials, per point
+        self.confidence = confidence
+        trials = errors.shape[-1]
+        self.mean = np.mean(errors, axis=-1)
+        self.variance = np.var(errors, axis=-1, ddof=1) if trials > 1 else np.zeros(self.mean.shape)
+        z = stats.norm.ppf(0.5 + confidence / 2)
+        half_width = z * np.sqrt(self.variance / trials)
+        self.ci_low = self.mean - half_width
+        self.ci_high = self.mean + half_width
+
+    def as_dict(self):
+        return {'snrs': self.snrs.tolist(),
+                'deviations': self.deviations.tolist(),
+                'paths': self.paths.tolist(),
+                'trials': self.errors.shape[-1],
+                'confidence': self.confidence,
+                'mean': self.mean.tolist(),
+                'variance': self.variance.tolist(),
+                'ci_low': self.ci_low.tolist(),
+                'ci_high': self.ci_high.tolist(),
+                'quality': None if self.quality is None else self._get_quality_fields()}
+
+    def _get_quality_fields(self):
+        # {field: nested lists like mean}
+        return {field: np.vectorize(operator.attrgetter(field), otypes=[object])(self.quality).tolist()
+                for field in metrics.ErrorStatistics.FIELDS}
+
+
+class SnrSweep(object):
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    def __init__(self, parameters, snrs, deviations=None, paths=None):
+        self._parameters = parameters
+        self._snrs = list(snrs)
+        self._deviations = list(deviations or [parameters.freq_deviation])
+        self._paths = list(paths or [parameters.channel_paths])
+        self.trials = 10
+        self.seed = 0
+        self.workers = None
+        self.confidence = 0.95
+        self.guard = 0.1
+
+    def run(self):
+        points = list(itertools.product(range(len(self._snrs)),
+                                        range(len(self._deviations)),
+                                        range(len(self._paths))))
+        shape = (len(self._snrs), len(self._deviations), len(self._paths))
+        errors = np.zeros(shape + (self.trials,))
+        quality = np.empty(shape, dtype=object)
+        for point in points:
+            quality[point] = metrics.ErrorStatistics()
+        workers = self.workers or os.cpu_count() or 1
+        chunk = max(1, int(math.ceil(len(points) * self.trials / (4.0 * workers))))
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = {}
+            for point in points:
+                for start in range(0, self.trials, chunk):
+                    trials = range(start, min(start + chunk, self.trials))
+                    task = self._make_task(point, trials)
+                    futures[pool.submit(_run_trials, *task)] = (point, trials)
+            for future in concurrent.futures.as_completed(futures):
+                point, trials = futures[future]
+                for trial, statistics in zip(trials, future.result()):
+                    errors[point][trial] = statistics.mse
+                    quality[point].merge(statistics)
+        return SweepResult(self._snrs, self._deviations, self._paths,
+                           errors, self.confidence, quality)
+
+    def _make_task(self, point, trials):
+        snr_index, deviation_index, paths_index = point
+        parameters = self._parameters.replace(
+            expected_snr=self._snrs[snr_index],
+            freq_deviation=self._deviations[deviation_index],
+            channel_paths=self._paths[paths_index])
+        # channel realisation depends on channel parameters only and trial
+        # seeds on grid position and trial number, never on task layout
+        channel_seed = self._make_seed(CHANNEL_SEED_KEY, deviation_index, paths_index)
+        flat_index = np.ravel_multi_index(point, (len(self._snrs), len(self._deviations), len(self._paths)))
+        trial_seeds = [self._make_seed(TRIAL_SEED_KEY, int(flat_index), trial) for trial in trials]
+        return parameters.as_dict(), channel_seed, trial_seeds, self.guard
+
+    def _make_seed(self, *key):
+        sequence = np.random.SeedSequence(self.seed, spawn_key=key)
+        return int(sequence.generate_state(1)[0])
+
+
+def _run_trials(parameters, channel_seed, trial_seeds, guard):
+    simulated = _get_worker_system(parameters, channel_seed)
+    simulated.get_block(simulated.NOISE_CHANNEL).expected_snr = parameters['expected_snr']
+    # statistics of every trial, merged by the caller
+    results = []
+    for seed in trial_seeds:
+        simulated.seed = seed
+        simulated.simulate()
+        results.append(system.measure_quality(simulated, guard))
+    return results
+
+
+def _get_worker_system(parameters, channel_seed):
+    key = (channel_seed,) + tuple(sorted((k, v) for k, v in parameters.items() if k != 'expected_snr'))
+    if key not in _worker_systems:
+        data = utils.SimulationParameters(**parameters)
+        simulated = system.SystemBuilder(data).build()
+        # one channel realisation for all trials, drawn once
+        simulated.fix_seed(simulated.MULTI_PATH_CHANNEL, channel_seed)
+        _worker_systems[key] = simulated
+    return _worker_systems[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo sweep of demodulation error versus SNR.")
+    parser.add_argument('--snr', type=float, nargs='+', required=True, help="expected SNRs [dB]")
+    parser.add_argument('--deviation', type=float, nargs='+', help="frequency deviations [Hz]")
+    parser.add_argument('--paths', type=int, nargs='+', help="multipath channel path counts")
+    parser.add_argument('--trials', type=int, default=10, help="trials per grid point")
+    parser.add_argument('--seed', type=int, default=0, help="root seed of all trials")
+    parser.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    parser.add_argument('--output', help="JSON file for results (default: stdout)")
+    args = parser.parse_args()
+
+    sweep = SnrSweep(utils.SimulationParameters.mock(), args.snr, args.deviation, args.paths)
+    sweep.trials = args.trials
+    sweep.seed = args.seed
+    sweep.workers = args.workers
+    system.store.write_json(sweep.run().as_dict(), args.output)
+
+
+if __name__ == "__main__":
+    main()
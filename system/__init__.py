@@ -1 +1,5 @@
 from .system import System
+from .builder import SystemBuilder
+from .store import SignalStore, StoredSystem
+from .cache import ResultCache
+from .quality import measure_quality
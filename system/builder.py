@@ -0,0 +1,100 @@
+import numpy as np
+
+import blocks
+from system.system import System
+
+
+class SystemBuilder(object):
+    # pylint: disable=too-few-public-methods
+    # Complex envelope sample rate as a multiple of the signal half band.
+    BASEBAND_OVERSAMPLING = 8
+    # echo spacing in passband samples
+    CHANNEL_DELAY = 120
+
+    def __init__(self, data, baseband=False, dtype=np.float64, doppler=None):
+        # with doppler [Hz], paths of channel fade instead of being static
+        self._data = data
+        self._baseband = baseband
+        self._dtype = dtype
+        self._doppler = doppler
+
+    @property
+    def half_band_width(self):
+        return self._data.modulating_freq + self._data.freq_deviation
+
+    def build(self):
+        system = System()
+        self._build_system_blocks(system)
+        system.baseband = self._baseband
+        system.dtype = self._dtype
+        system.sampling_frequency = self._get_sampling_frequency()
+        return system
+
+    def _build_system_blocks(self, system):
+        blocks_cascade = [('generator', self._make_generator()),
+                          ('modulator', self._make_modulator()),
+                          ('channel', self._make_channel()),
+                          ('noiser', self._make_noiser()),
+                          ('filter', self._make_band_pass_filter()),
+                          ('demodulator', self._make_demodulator())]
+        for name, block in blocks_cascade:
+            system.append_block(block, name)
+
+        # just for sake of readability later
+        system.GENERATOR = 0
+        system.MODULATOR = 1
+        system.MULTI_PATH_CHANNEL = 2
+        system.NOISE_CHANNEL = 3
+        system.LPF = 4
+        system.DEMODULATOR = 5
+
+    def _make_generator(self):
+        generator = blocks.generators.BandNoiseGenerator()
+        generator.generation_time = self._data.generation_time
+        generator.bandwidth = self._data.modulating_freq
+        return generator
+
+    def _make_modulator(self):
+        modulator = blocks.modems.FrequencyModulator()
+        modulator.frequency_deviation = self._data.freq_deviation
+        modulator.carrier_frequency = self._data.carrier_freq
+        return modulator
+
+    def _make_channel(self):
+        # the same echo times, rounded to the coarser baseband sampling
+        ratio = self._get_sampling_frequency() / self._data.sampling_freq
+        delay = max(1, int(round(self.CHANNEL_DELAY * ratio)))
+        if self._doppler is None:
+            channel = blocks.channels.MultiPathChannel(delay=delay, paths=self._data.channel_paths)
+        else:
+            channel = blocks.channels.FadingChannel(delay=delay, paths=self._data.channel_paths,
+                                                    doppler=self._doppler)
+        channel.carrier_frequency = self._data.carrier_freq
+        return channel
+
+    def _make_noiser(self):
+        noise_maker = blocks.noisers.BandNoiser()
+        noise_maker.expected_snr = self._data.expected_snr
+        noise_maker.freqs = self._get_signal_band()
+        return noise_maker
+
+    def _make_band_pass_filter(self):
+        filter_block = blocks.filters.BandPassFilter()
+        filter_block.freqs = self._get_signal_band()
+        return filter_block
+
+    def _make_demodulator(self):
+        demodulator = blocks.modems.FrequencyDemodulator()
+        demodulator.frequency_deviation = self._data.freq_deviation
+        demodulator.carrier_frequency = self._data.carrier_freq
+        return demodulator
+
+    def _get_sampling_frequency(self):
+        if self._baseband:
+            return self.BASEBAND_OVERSAMPLING * self.half_band_width
+        return self._data.sampling_freq
+
+    def _get_signal_band(self):
+        carrier_freq = self._data.carrier_freq
+        half_band_width = self.half_band_width
+        return [f + carrier_freq for f in (-half_band_width, half_band_width)]
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from blocks.lazy import LazyModule
+from system.store import SignalStore, describe_system, json_default
+
+scipy = LazyModule('scipy')
+
+
+class ResultCache(object):
+    # Whole runs stored as SignalStore directories named by a hash of the
+    # system description, seed and library versions. Least recently used
+    # runs are evicted once total size exceeds max_bytes.
+    INDEX_FILE = 'index.json'
+    # bump when blocks start computing different results for same inputs
+    VERSION = 1
+
+    def __init__(self, path, max_bytes=2 ** 30):
+        self._path = path
+        self._max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._evict()
+
+    @property
+    def size(self):
+        return sum(entry['bytes'] for entry in self._load_index().values())
+
+    def __len__(self):
+        return len(self._load_index())
+
+    def make_key(self, system, seed):
+        # block seeds and channel taps are among block parameters
+        description = {'system': describe_system(system, seed),
+                       'versions': {'cache': self.VERSION,
+                                    'python': platform.python_version(),
+                                    'numpy': np.__version__,
+                                    'scipy': scipy.__version__}}
+        text = json.dumps(description, sort_keys=True, default=json_default)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def load(self, system, seed):
+        # StoredSystem of an equal run, or None
+        key = self.make_key(system, seed)
+        index = self._load_index()
+        if key not in index:
+            return None
+        index[key]['used'] = time.time()
+        self._save_index(index)
+        return SignalStore(os.path.join(self._path, key)).open_system()
+
+    def save(self, system, seed):
+        # Run is written aside and renamed into place, so an interrupted
+        # save never looks like a hit.
+        key = self.make_key(system, seed)
+        temporary = tempfile.mkdtemp(dir=self._path, prefix='.')
+        try:
+            SignalStore(temporary).save_system(system, seed)
+            target = os.path.join(self._path, key)
+            shutil.rmtree(target, ignore_errors=True)
+            os.rename(temporary, target)
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        index = self._load_index()
+        index[key] = {'bytes': self._get_directory_size(target), 'used': time.time()}
+        self._save_index(index)
+        self._evict(keep=key)
+        return SignalStore(target).open_system()
+
+    def clear(self):
+        for key in self._load_index():
+            shutil.rmtree(os.path.join(self._path, key), ignore_errors=True)
+        self._save_index({})
+
+    def _evict(self, keep=None):
+        index = self._load_index()
+        total = sum(entry['bytes'] for entry in index.values())
+        for key in sorted(index, key=lambda key: index[key]['used']):
+            if total <= self._max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self._path, key), ignore_errors=True)
+            total -= index.pop(key)['bytes']
+        self._save_index(index)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self._path, self.INDEX_FILE)) as index:
+                return json.load(index)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        # replaced atomically, readers never see half written index
+        path = os.path.join(self._path, self.INDEX_FILE)
+        with open(path + '.tmp', 'w') as index_file:
+            json.dump(index, index_file, indent=2)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _get_directory_size(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
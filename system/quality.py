@@ -0,0 +1,16 @@
+from blocks import metrics
+
+
+def measure_quality(simulated, guard):
+    # ErrorStatistics of demodulated signal against modulating one, for a
+    # system made by SystemBuilder and simulated already.
+    demodulated = simulated.get_block(simulated.DEMODULATOR).output
+    modulating = simulated.get_block(simulated.MODULATOR).input
+    # Both ends are skipped, demodulator output is unreliable there. Delay
+    # of demodulated signal (channel paths, causal filters) is estimated
+    # and compensated, so it is not counted as error.
+    margin = int(guard * demodulated.shape[-1])
+    stop = demodulated.shape[-1] - margin
+    meter = metrics.QualityMeter(delay=None)
+    meter.update(modulating[..., margin:stop], demodulated[..., margin:stop])
+    return meter.flush()
@@ -0,0 +1,276 @@
+import json
+import os
+
+import numpy as np
+
+
+class SignalStore(object):
+    # Directory of raw sample files, opened as read-only np.memmap, and of
+    # metadata.json describing them and the system which produced them.
+    # Appended signals are kept time major, so frames of batched
+    # (rows, samples) signals are written contiguously; they are read back
+    # through a transposed view, without copying.
+    METADATA_FILE = 'metadata.json'
+
+    def __init__(self, path):
+        self._path = path
+        self._opened = {}
+        metadata_path = os.path.join(path, self.METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as metadata:
+                self._metadata = json.load(metadata)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._metadata = {'signals': {}, 'system': None}
+
+    def __contains__(self, key):
+        return key in self._metadata['signals']
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def metadata(self):
+        return self._metadata
+
+    def keys(self):
+        return list(self._metadata['signals'])
+
+    def write(self, key, samples):
+        # tuples, e.g. (b, a) filter designs, are written part by part
+        self.remove(key)
+        if isinstance(samples, tuple):
+            for index, part in enumerate(samples):
+                self.write("{0}.{1}".format(key, index), part)
+            self._metadata['signals'][key] = {'parts': len(samples)}
+        else:
+            samples = np.asarray(samples)
+            entry = self._make_entry(key, samples.dtype, samples.shape, time_major=False)
+            if samples.size:
+                mapped = np.memmap(self._get_file(entry), dtype=samples.dtype, mode='w+', shape=samples.shape)
+                mapped[...] = samples
+                mapped.flush()
+                del mapped
+            else:
+                open(self._get_file(entry), 'wb').close()
+        self.save_metadata()
+
+    def append(self, key, frame):
+        # call save_metadata() once all frames are appended
+        entry = self._metadata['signals'].get(key)
+        if entry is None:
+            entry = self._make_entry(key, frame.dtype, frame.shape[:-1] + (0,), time_major=True)
+            open(self._get_file(entry), 'wb').close()
+        if np.dtype(entry['dtype']) != frame.dtype or tuple(entry['shape'][:-1]) != frame.shape[:-1]:
+            e = "Frame {0} {1} does not match {2}.".format(frame.dtype, frame.shape, key)
+            raise ValueError(e)
+        with open(self._get_file(entry), 'ab') as samples_file:
+            np.ascontiguousarray(frame.T).tofile(samples_file)
+        entry['shape'][-1] += frame.shape[-1]
+        self._opened.pop(key, None)
+
+    def read(self, key):
+        if key in self._opened:
+            return self._opened[key]
+        entry = self._metadata['signals'][key]
+        if 'parts' in entry:
+            samples = tuple(self.read("{0}.{1}".format(key, index)) for index in range(entry['parts']))
+        else:
+            shape = tuple(entry['shape'])
+            stored_shape = shape[::-1] if entry['time_major'] else shape
+            if np.prod(shape, dtype=int):
+                samples = np.memmap(self._get_file(entry), dtype=entry['dtype'], mode='r', shape=stored_shape)
+            else:
+                samples = np.zeros(stored_shape, dtype=entry['dtype'])
+            if entry['time_major']:
+                samples = samples.T
+        self._opened[key] = samples
+        return samples
+
+    def remove(self, key):
+        entry = self._metadata['signals'].pop(key, None)
+        self._opened.pop(key, None)
+        if entry is None:
+            return
+        for index in range(entry.get('parts', 0)):
+            self.remove("{0}.{1}".format(key, index))
+        if 'file' in entry:
+            os.remove(self._get_file(entry))
+
+    def save_system(self, system, seed=None):
+        # records every block output and extra signals, e.g. noise
+        self._save_system_info(system, seed)
+        for block in system:
+            name = system.get_name(block)
+            for signal, samples in block.recorded_signals.items():
+                if samples is not None:
+                    self.write("{0}.{1}".format(name, signal), samples)
+
+    def record_stream(self, system, frame_size, node=None, seed=None):
+        # Streams outputs of blocks on the path to node straight to disk,
+        # so the run may be longer than memory allows. FRAME_SIGNALS of
+        # blocks, e.g. noise, are appended with outputs, STATIC_SIGNALS,
+        # e.g. filter design, are written once the stream ends.
+        self._save_system_info(system, seed)
+        names = set(system.names)
+        for key in self.keys():
+            if key.split('.')[0] in names:
+                self.remove(key)
+        streamed = []
+
+        def observer(block, frame):
+            name = system.get_name(block)
+            if block not in streamed:
+                streamed.append(block)
+            self.append("{0}.output".format(name), frame)
+            for signal in block.FRAME_SIGNALS:
+                self.append("{0}.{1}".format(name, signal), getattr(block, signal))
+        for _ in system.stream(frame_size, node, observer):
+            pass
+        for block in streamed:
+            for signal in block.STATIC_SIGNALS:
+                samples = getattr(block, signal)
+                if samples is not None:
+                    self.write("{0}.{1}".format(system.get_name(block), signal), samples)
+        self.save_metadata()
+
+    def open_system(self):
+        return StoredSystem(self)
+
+    def save_metadata(self):
+        with open(os.path.join(self._path, self.METADATA_FILE), 'w') as metadata:
+            json.dump(self._metadata, metadata, indent=2, default=json_default)
+
+    def _save_system_info(self, system, seed):
+        self._metadata['system'] = describe_system(system, seed)
+        self.save_metadata()
+
+    def _make_entry(self, key, dtype, shape, time_major):
+        entry = {'file': key.replace(os.sep, '_') + '.bin',
+                 'dtype': np.dtype(dtype).str,
+                 'shape': list(shape),
+                 'time_major': time_major}
+        self._metadata['signals'][key] = entry
+        self._opened.pop(key, None)
+        return entry
+
+    def _get_file(self, entry):
+        return os.path.join(self._path, entry['file'])
+
+
+class StoredSystem(object):
+    # Read-only stand-in for a simulated System, as far as analysis and
+    # plots go. Signals are memory mapped, nothing is computed again.
+    def __init__(self, store):
+        info = store.metadata['system']
+        if info is None:
+            raise ValueError("No system was saved in {0}.".format(store.path))
+        self._info = info
+        self._blocks = [StoredBlock(self, store, entry) for entry in info['blocks']]
+        self._names = {block.name: block for block in self._blocks}
+        for name, value in info['constants'].items():
+            setattr(self, name, value)
+
+    def __iter__(self):
+        return self._blocks.__iter__()
+
+    @property
+    def names(self):
+        return [block.name for block in self._blocks]
+
+    @property
+    def sampling_frequency(self):
+        return self._info['sampling_frequency']
+
+    @property
+    def baseband(self):
+        return self._info['baseband']
+
+    @property
+    def seed(self):
+        return self._info['seed']
+
+    @property
+    def timeline(self):
+        if not self._blocks:
+            return None
+        first = self._blocks[0]
+        if first.input is not None:
+            return first.input
+        # streamed runs do not keep time, it is regenerated
+        return np.arange(first.output.shape[-1]) / self.sampling_frequency
+
+    def get_block(self, node):
+        if isinstance(node, str):
+            return self._names[node]
+        return self._blocks[node]
+
+    def get_blocks(self):
+        return self._blocks
+
+
+class StoredBlock(object):
+    # Recorded signals are attributes, e.g. output, noise or design.
+    def __init__(self, system, store, entry):
+        self._system = system
+        self._store = store
+        self.name = entry['name']
+        self.type_name = entry['type']
+        self.parameters = entry['parameters']
+        self.sources = entry['sources']
+
+    def __getattr__(self, attribute):
+        key = "{0}.{1}".format(self.name, attribute)
+        if attribute.startswith('_') or key not in self._store:
+            raise AttributeError("{0} has no recorded {1}.".format(self.name, attribute))
+        return self._store.read(key)
+
+    def __repr__(self):
+        return "Stored {0} ({1})".format(self.type_name, self.name)
+
+    @property
+    def input(self):
+        key = "{0}.input".format(self.name)
+        if key in self._store:
+            return self._store.read(key)
+        if 'input' in self.sources:
+            return self._system.get_block(self.sources['input']).output
+        return None
+
+
+def describe_system(system, seed=None):
+    # everything but signals needed to tell a run apart
+    blocks = []
+    for block in system:
+        blocks.append({'name': system.get_name(block),
+                       'type': type(block).__name__,
+                       'parameters': block.parameters,
+                       'sources': {port: system.get_name(source)
+                                   for port, source in system.get_sources(block).items()}})
+    constants = {name: value for name, value in vars(system).items() if name.isupper()}
+    return {'sampling_frequency': system.sampling_frequency,
+            'baseband': system.baseband,
+            'seed': seed,
+            'constants': constants,
+            'blocks': blocks}
+
+
+def json_default(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, np.dtype):
+        return value.name
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': value.entropy, 'spawn_key': list(value.spawn_key)}
+    raise TypeError("{0} is not JSON serializable.".format(type(value)))
+
+
+def write_json(content, path=None):
+    # to file at path, or to stdout without one, e.g. for results of CLIs
+    result = json.dumps(content, indent=2, default=json_default)
+    if path:
+        with open(path, 'w') as output:
+            output.write(result)
+    else:
+        print(result)
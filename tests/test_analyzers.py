@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+from scipy import signal
+
+from blocks.analyzers import SpectrumAnalyzer
+
+
+class SpectrumAnalyzerTest(unittest.TestCase):
+    def setUp(self):
+        random = np.random.default_rng(0)
+        self.real = np.sin(0.3 * np.arange(20000)) + random.standard_normal(20000)
+        self.complex = np.exp(0.2j * np.arange(20000)) + random.standard_normal((2, 20000))
+
+    def _stream(self, analyzer, samples, frame_size):
+        analyzer.sampling_frequency = 1e3
+        analyzer.reset_stream()
+        for start in range(0, samples.shape[-1], frame_size):
+            np.testing.assert_array_equal(analyzer.process_frame(samples[..., start:start + frame_size]),
+                                          samples[..., start:start + frame_size])
+        analyzer.flush_stream()
+        return analyzer.spectrum
+
+    def _welch(self, samples, scaling='density', **kwargs):
+        frequencies, spectrum = signal.welch(samples, 1e3, nperseg=256, return_onesided=False,
+                                             scaling=scaling, **kwargs)
+        return np.fft.fftshift(frequencies), np.fft.fftshift(spectrum, axes=-1)
+
+    def test_stream_matches_welch(self):
+        # frames are no multiple of segment step, segments cross them
+        analyzer = SpectrumAnalyzer(segment_size=256)
+        frequencies, expected = self._welch(self.real)
+        np.testing.assert_allclose(self._stream(analyzer, self.real, 1000), expected, rtol=1e-10)
+        np.testing.assert_allclose(analyzer.frequencies, frequencies)
+
+    def test_stream_matches_welch_on_complex_rows(self):
+        analyzer = SpectrumAnalyzer(segment_size=256, overlap=100, fft_size=512, scaling='spectrum')
+        _, expected = self._welch(self.complex, 'spectrum', noverlap=100, nfft=512)
+        np.testing.assert_allclose(self._stream(analyzer, self.complex, 333), expected, rtol=1e-10)
+
+    def test_batch_matches_stream(self):
+        analyzer = SpectrumAnalyzer(segment_size=256)
+        analyzer.sampling_frequency = 1e3
+        analyzer.input = self.real
+        batch = analyzer.output.copy()
+        np.testing.assert_allclose(self._stream(analyzer, self.real, 777), batch, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+from blocks.channels import FadingChannel, MultiPathChannel
+
+
+class FadingChannelTest(unittest.TestCase):
+    def setUp(self):
+        # grid step of 97 samples, longer than a frame
+        self.channel = FadingChannel(delay=3, paths=2, doppler=10.0, seed=1)
+        self.channel.sampling_frequency = 1e6
+        self.channel.baseband = True
+        self.channel.carrier_frequency = 1e5
+        self.samples = np.exp(2j * np.pi * 0.01 * np.arange(1000))
+
+    def test_gains_do_not_depend_on_span(self):
+        gains = self.channel.get_gains(0, 1000)
+        for start in range(0, 1000, 57):
+            stop = min(start + 57, 1000)
+            np.testing.assert_allclose(self.channel.get_gains(start, stop), gains[..., start:stop], atol=1e-12)
+
+    def test_stream_matches_batch_on_short_frames(self):
+        self.channel.input = self.samples
+        batch = self.channel.output
+        self.channel.reset_stream()
+        frames = [self.channel.process_frame(self.samples[start:start + 57])
+                  for start in range(0, self.samples.size, 57)]
+        frames.append(self.channel.flush_stream())
+        np.testing.assert_allclose(np.concatenate(frames, axis=-1), batch, atol=1e-12)
+
+
+class MultiPathChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.random = np.random.default_rng(0)
+
+    def _assert_dense(self, channel, samples):
+        # same as convolution with impulse response, cut to input length
+        response = channel.impulse_response
+        rows = np.broadcast(samples[..., :1], response[..., :1]).shape[:-1]
+        samples = np.broadcast_to(samples, rows + samples.shape[-1:])
+        response = np.broadcast_to(response, rows + response.shape[-1:])
+        expected = np.array([np.convolve(x, h)[:samples.shape[-1]]
+                             for x, h in zip(samples.reshape(-1, samples.shape[-1]),
+                                             response.reshape(-1, response.shape[-1]))])
+        channel.input = samples
+        np.testing.assert_allclose(channel.output, expected.reshape(rows + (-1,)), atol=1e-12)
+
+    def test_sparse_taps(self):
+        channel = MultiPathChannel(delay=7, paths=5, seed=1)
+        channel.CHUNK_SIZE = 100
+        self._assert_dense(channel, self.random.standard_normal(1000))
+
+    def test_sparse_taps_with_trials(self):
+        channel = MultiPathChannel(delay=7, paths=5, trials=3, seed=1)
+        channel.CHUNK_SIZE = 100
+        self._assert_dense(channel, self.random.standard_normal(1000))
+        self._assert_dense(channel, self.random.standard_normal((3, 1000)))
+
+    def test_sparse_taps_in_baseband(self):
+        channel = MultiPathChannel(delay=7, paths=5, trials=2, seed=1)
+        channel.baseband = True
+        channel.sampling_frequency = 1e6
+        channel.carrier_frequency = 1e5
+        self._assert_dense(channel, self.random.standard_normal(1000) + 1j * self.random.standard_normal(1000))
+
+    def test_many_taps(self):
+        channel = MultiPathChannel(delay=3, paths=80, trials=2, seed=1)
+        self.assertGreater(channel.gains.shape[-1], channel.SPARSE_TAPS_LIMIT)
+        self._assert_dense(channel, self.random.standard_normal(1000))
+
+
+if __name__ == '__main__':
+    unittest.main()
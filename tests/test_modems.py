@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+import utils
+from blocks import generators, modems
+
+
+class DecimatingFrequencyDemodulatorTest(unittest.TestCase):
+    def setUp(self):
+        parameters = utils.SimulationParameters.mock()
+        parameters = parameters.replace(generation_time=4 * parameters.generation_time)
+        generator = generators.BandNoiseGenerator()
+        generator.generation_time = parameters.generation_time
+        generator.bandwidth = parameters.modulating_freq
+        generator.sampling_frequency = parameters.sampling_freq
+        generator.seed = 1
+        modulator = modems.FrequencyModulator()
+        modulator.carrier_frequency = parameters.carrier_freq
+        modulator.frequency_deviation = parameters.freq_deviation
+        modulator.sampling_frequency = parameters.sampling_freq
+        modulator.input = generator.output
+        self.modulated = modulator.output
+        self.hilbert = self._make(modems.FrequencyDemodulator(), parameters)
+        self.decimating = self._make(modems.DecimatingFrequencyDemodulator(), parameters)
+        self.decimating.bandwidth = parameters.modulating_freq + parameters.freq_deviation
+        self.decimating.interpolate = True
+
+    def _make(self, demodulator, parameters):
+        demodulator.carrier_frequency = parameters.carrier_freq
+        demodulator.frequency_deviation = parameters.freq_deviation
+        demodulator.sampling_frequency = parameters.sampling_freq
+        demodulator.input = self.modulated
+        return demodulator
+
+    def test_interpolated_output_matches_hilbert_without_lag(self):
+        # noiseless, so both follow the modulating signal; ends are left out
+        expected, actual = self.hilbert.output, self.decimating.output
+        self.assertEqual(actual.shape, expected.shape)
+        margin = expected.shape[-1] // 10
+        error = np.abs(actual - expected)[..., margin:-margin]
+        self.assertLess(np.max(error), 1e-2)
+
+    def test_stream_matches_batch(self):
+        for interpolate in (False, True):
+            self.decimating.interpolate = interpolate
+            batch = self.decimating.output
+            for frame_size in (97, 4096):
+                self.decimating.reset_stream()
+                frames = [self.decimating.process_frame(self.modulated[start:start + frame_size])
+                          for start in range(0, self.modulated.shape[-1], frame_size)]
+                frames.append(self.decimating.flush_stream())
+                np.testing.assert_allclose(np.concatenate(frames, axis=-1), batch, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+import numpy as np
+
+from blocks.generators import BandNoiseGenerator
+from blocks.noisers import BandNoiser
+
+
+class PrecisionTest(unittest.TestCase):
+    # a seed gives the same realisation in single precision, rounded
+    def _compute(self, block, dtype):
+        block.seed = 5
+        block.sampling_frequency = 1e6
+        block.dtype = dtype
+        return block.output
+
+    def test_generator(self):
+        generator = BandNoiseGenerator()
+        generator.generation_time = 1e-2
+        generator.bandwidth = 1e3
+        expected = self._compute(generator, np.float64)
+        actual = self._compute(generator, np.float32)
+        self.assertEqual(actual.dtype, np.float32)
+        np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+    def test_noiser(self):
+        for baseband in (False, True):
+            noiser = BandNoiser()
+            noiser.baseband = baseband
+            noiser.freqs = [-1e4, 1e4] if baseband else [9e4, 1.1e5]
+            noiser.input = np.exp(1j * 0.01 * np.arange(10000)) if baseband else np.sin(0.6 * np.arange(10000))
+            expected = self._compute(noiser, np.float64)
+            actual = self._compute(noiser, np.float32)
+            np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
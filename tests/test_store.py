@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import plots
+import system
+import utils
+
+
+class RecordStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.system = system.SystemBuilder(utils.SimulationParameters.mock()).build()
+        self.system.seed = 2
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stored_stream_plots(self):
+        store = system.SignalStore(os.path.join(self.directory, 'run'))
+        store.record_stream(self.system, 4096, seed=2)
+        stored = system.SignalStore(store.path).open_system()
+        noiser = stored.get_block(stored.NOISE_CHANNEL)
+        self.assertEqual(noiser.noise.shape, noiser.output.shape)
+        self.assertIsNotNone(stored.get_block(stored.LPF).design)
+        self.assertIsNotNone(stored.get_block(stored.MULTI_PATH_CHANNEL).impulse_response)
+        output_dir = os.path.join(self.directory, 'plots')
+        os.makedirs(output_dir)
+        plots.SystemPlotMaker.from_store(store.path, output_dir, formats=('png',), workers=1).make()
+        self.assertTrue(os.listdir(output_dir))
+
+    def test_recorded_noise_is_added_noise(self):
+        store = system.SignalStore(self.directory)
+        store.record_stream(self.system, 4096, seed=2)
+        noiser = store.open_system().get_block(self.system.NOISE_CHANNEL)
+        channel = store.open_system().get_block(self.system.MULTI_PATH_CHANNEL)
+        np.testing.assert_allclose(np.asarray(noiser.output) - channel.output, noiser.noise, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
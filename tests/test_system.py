@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+import utils
+import system
+from blocks import modems
+from blocks.combiners import Combiner
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.system = system.SystemBuilder(utils.SimulationParameters.mock()).build()
+
+    def test_rejects_combiner_before_any_frame(self):
+        combiner = Combiner()
+        self.system.add_block(combiner)
+        self.system.connect(self.system.DEMODULATOR, combiner)
+        frames = []
+        with self.assertRaises(TypeError):
+            next(self.system.stream(4096, observer=lambda block, frame: frames.append(block)))
+        self.assertFalse(frames)
+
+    def test_stream_matches_simulate(self):
+        # bounds System.stream documents, without noise
+        self.system.seed = 2
+        self.system.connect(self.system.MULTI_PATH_CHANNEL, self.system.LPF)
+        self.system.simulate()
+        filter_block = self.system.get_block(self.system.LPF)
+        expected = [filter_block.output.copy(), self.system.get_block(self.system.DEMODULATOR).output.copy()]
+        for frame_size in (1000, 4096):
+            filtered = []
+
+            def observer(block, frame, filtered=filtered):
+                if block is filter_block:
+                    filtered.append(frame)
+            demodulated = np.concatenate(list(self.system.stream(frame_size, observer=observer)))
+            np.testing.assert_allclose(np.concatenate(filtered), expected[0], atol=1e-5)
+            self.assertEqual(demodulated.shape, expected[1].shape)
+            context = modems.FrequencyDemodulator.STREAM_CONTEXT
+            error = np.abs(demodulated - expected[1])[context:-context]
+            self.assertLess(np.max(error), 1e-2)
+
+
+def simulate_without_noise(dtype='float64', baseband=False):
+    simulated = system.SystemBuilder(utils.SimulationParameters.mock(), baseband=baseband, dtype=dtype).build()
+    simulated.seed = 3
+    simulated.connect(simulated.MULTI_PATH_CHANNEL, simulated.LPF)
+    simulated.simulate()
+    return simulated.get_block(simulated.DEMODULATOR).output
+
+
+class PrecisionTest(unittest.TestCase):
+    # tolerances System.dtype documents
+    def test_single_precision_passband(self):
+        error = np.abs(simulate_without_noise('float32') - simulate_without_noise())
+        margin = error.shape[-1] // 10
+        self.assertLess(np.max(error[margin:-margin]), 5e-4)
+        self.assertLess(np.max(error), 2e-2)
+
+    def test_single_precision_baseband(self):
+        error = np.abs(simulate_without_noise('float32', True) - simulate_without_noise(baseband=True))
+        self.assertLess(np.max(error), 2e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,7 @@ class DataLoader(object):
     generation_time = None
     expected_snr = None
     sampling_freq = None
+    channel_paths = 5
 
     def __new__(cls):
         # singleton pattern
@@ -28,12 +29,8 @@ class DataLoader(object):
         return cls._inst
 
     def mock(self):
-        self.carrier_freq = 100e6
-        self.modulating_freq = 5e6
-        self.freq_deviation = 1 * self.modulating_freq
-        self.generation_time = 50 / self.modulating_freq
-        self.sampling_freq = 32 * self.carrier_freq
-        self.expected_snr = 20
+        for field, value in SimulationParameters.mock().as_dict().items():
+            setattr(self, field, value)
 
     def load_via_stdin(self):
         self._load_data()
@@ -78,13 +75,59 @@ class DataLoader(object):
         self.expected_snr = ast.literal_eval(snr)
 
     def _validate(self):
-        if self.modulating_freq / self.carrier_freq > self.MUCH_LOWER:
-            error = "Modulating freq should be much lower than carrier."
-            raise BadDataException(error)
-
-        if self.freq_deviation > self.carrier_freq:
-            error = "Frequency deviation should be lower than carrier freq."
-            raise BadDataException(error)
+        validate(self)
+
+
+def validate(data):
+    # DataLoader or SimulationParameters
+    if data.modulating_freq / data.carrier_freq > DataLoader.MUCH_LOWER:
+        error = "Modulating freq should be much lower than carrier."
+        raise BadDataException(error)
+
+    if data.freq_deviation > data.carrier_freq:
+        error = "Frequency deviation should be lower than carrier freq."
+        raise BadDataException(error)
+
+
+class SimulationParameters(object):
+    # Plain, picklable counterpart of DataLoader. Many of them can coexist,
+    # e.g. one per point of a parameter sweep.
+    FIELDS = ('carrier_freq', 'modulating_freq', 'freq_deviation',
+              'generation_time', 'expected_snr', 'sampling_freq',
+              'channel_paths')
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise BadDataException("Unknown parameters: {0}".format(sorted(unknown)))
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_loader(cls, loader):
+        return cls(**{field: getattr(loader, field) for field in cls.FIELDS})
+
+    @classmethod
+    def mock(cls, **values):
+        # Values not given follow from given ones as in the mock scenario,
+        # e.g. sampling at 32 times carrier frequency.
+        values = dict(values)
+        values.setdefault('carrier_freq', 100e6)
+        values.setdefault('modulating_freq', 5e6)
+        values.setdefault('freq_deviation', 1 * values['modulating_freq'])
+        values.setdefault('generation_time', 50 / values['modulating_freq'])
+        values.setdefault('sampling_freq', 32 * values['carrier_freq'])
+        values.setdefault('expected_snr', 20)
+        values.setdefault('channel_paths', DataLoader.channel_paths)
+        return cls(**values)
+
+    def replace(self, **values):
+        updated = self.as_dict()
+        updated.update(values)
+        return SimulationParameters(**updated)
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
 
 
 class BadDataException(Exception):